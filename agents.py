@@ -0,0 +1,74 @@
+import copy
+
+import numpy as np
+
+ROLE_NAMES = ("chaser", "helper", "blocker")
+CHASER, HELPER, BLOCKER = range(len(ROLE_NAMES))
+NO_AGENT = -1
+
+
+class AgentTable:
+    def __init__(self, shape, positions, roles=None):
+        count = len(positions)
+        self.positions = np.array(positions, dtype=np.int64).reshape(count, 2)
+        self.roles = np.zeros(count, dtype=np.int8) if roles is None else np.array(roles, dtype=np.int8)
+        self.delays = np.zeros(count, dtype=np.int64)
+        self.reindex(shape)
+
+    def copy(self, occupancy=True):
+        table = copy.copy(self)
+        table.occupancy = self.occupancy.copy() if occupancy else None
+        table.positions = self.positions.copy()
+        table.roles = self.roles.copy()
+        table.delays = self.delays.copy()
+        return table
+
+    def reindex(self, shape):
+        self.occupancy = np.full(shape, NO_AGENT, dtype=np.int32)
+        self.occupancy[self.positions[:, 0], self.positions[:, 1]] = np.arange(len(self.positions))
+
+    def __len__(self):
+        return len(self.positions)
+
+    def position(self, agent):
+        x, y = self.positions[agent]
+        return int(x), int(y)
+
+    def agent_at(self, pos):
+        return int(self.occupancy[pos[0], pos[1]])
+
+    def is_occupied(self, pos):
+        return self.occupancy[pos[0], pos[1]] != NO_AGENT
+
+    def move(self, agent, pos):
+        x, y = self.positions[agent]
+        if self.occupancy[x, y] == agent:
+            self.occupancy[x, y] = NO_AGENT
+        self.occupancy[pos[0], pos[1]] = agent
+        self.positions[agent] = pos
+
+    def restore(self, positions, roles, delays):
+        self.occupancy[self.positions[:, 0], self.positions[:, 1]] = NO_AGENT
+        self.positions[:] = positions
+        self.roles[:] = roles
+        self.delays[:] = delays
+        self.occupancy[self.positions[:, 0], self.positions[:, 1]] = np.arange(len(self.positions))
+
+    def set_roles(self, roles):
+        self.roles[:] = roles
+
+    def role_name(self, agent):
+        return ROLE_NAMES[self.roles[agent]]
+
+    def with_role(self, role):
+        return np.flatnonzero(self.roles == role).tolist()
+
+    def position_list(self):
+        return list(map(tuple, self.positions.tolist()))
+
+    def clusters(self):
+        positions = self.position_list()
+        clusters = {name: [] for name in ROLE_NAMES}
+        for pos, role in zip(positions, self.roles.tolist()):
+            clusters[ROLE_NAMES[role]].append(pos)
+        return clusters
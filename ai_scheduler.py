@@ -0,0 +1,62 @@
+from cooperative_astar import reserved_next_position
+from reservation_table import ReservedPath
+from search_stats import SearchStats
+
+AI_BUDGET = 512
+NEAR_DISTANCE = 8
+COUNTERS = ("replanned", "deferred", "followed", "delayed")
+
+
+class AIScheduler:
+    def __init__(self, budget=AI_BUDGET, near_distance=NEAR_DISTANCE):
+        self.budget = budget
+        self.near_distance = near_distance
+        self.last = dict.fromkeys(COUNTERS, 0)
+        self.totals = dict.fromkeys(COUNTERS, 0)
+
+    def priority(self, npc, group_name, player_position, reservations):
+        distance = abs(npc[0] - player_position[0]) + abs(npc[1] - player_position[1])
+        if group_name == "chaser" and distance <= self.near_distance:
+            return 0, distance
+        if npc in reservations.invalidated:
+            return 1, distance
+        if group_name == "blocker" and distance > self.near_distance:
+            return 4, distance
+        if reservations.path_for(npc) is None:
+            return 2, distance
+        return 3, distance
+
+    def plan(self, grid, clustered_npcs, target_positions, fields, reservations, delays, occupied_positions, stats=None):
+        stats = stats if stats is not None else SearchStats()
+        start = stats.total().expanded
+        counts = dict.fromkeys(COUNTERS, 0)
+        planned_paths = {}
+        queue = []
+        for group_name, npc_group in clustered_npcs.items():
+            for npc in npc_group:
+                if delays.get(npc, 0) > 0:
+                    planned_paths[npc] = npc
+                    occupied_positions.add(npc)
+                    counts["delayed"] += 1
+                elif reservations.path_for(npc) is not None and npc not in reservations.stale:
+                    planned_paths[npc] = reserved_next_position(grid, npc, group_name, target_positions[group_name], fields[group_name], reservations, delays, occupied_positions)
+                    counts["followed"] += 1
+                else:
+                    queue.append((self.priority(npc, group_name, target_positions["chaser"], reservations), npc, group_name))
+
+        queue.sort()
+        for _, npc, group_name in queue:
+            target = target_positions[group_name]
+            if self.budget is not None and stats.total().expanded - start >= self.budget:
+                counts["deferred"] += 1
+                if reservations.path_for(npc) is None:
+                    reservations.reserve(npc, ReservedPath([npc, npc], reservations.time, group_name, target))
+            else:
+                reservations.release(npc)
+                counts["replanned"] += 1
+            planned_paths[npc] = reserved_next_position(grid, npc, group_name, target, fields[group_name], reservations, delays, occupied_positions, stats.role(group_name))
+
+        self.last = counts
+        for name, count in counts.items():
+            self.totals[name] += count
+        return planned_paths
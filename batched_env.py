@@ -0,0 +1,390 @@
+import numpy as np
+
+from agents import HELPER, BLOCKER
+from distance_field import FIELD_INF, STEP_COST, distance_fields
+from main import MAXIUM_TURNS, MAX_REGROUP_TURN, ENEMY_NUMBER
+from npc_clustering import REGROUP_DRIFT, batch_kmeans_clustering, batch_rank_roles, batch_nearest_clusters, batch_drift
+from settings import GRID_SIZE, DIRECTIONS
+from skill_targets import DIAMOND_OFFSETS, DIAMOND_DISTANCE
+from terrain import EMPTY, MUD, WATER, WALL, TERRAIN_DELAY, TERRAIN_PROBABILITIES, PASSABLE
+
+DIRECTION_NAMES = tuple(DIRECTIONS)
+DIRECTION_OFFSETS = np.array([DIRECTIONS[name] for name in DIRECTION_NAMES])
+NEIGHBOR_OFFSETS = np.array([(-1, 0), (1, 0), (0, -1), (0, 1)])
+RING_OFFSETS = np.array([(0, -1), (1, -1), (1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1)])
+CLEAR_OFFSETS = np.array([(dx, dy) for dx in range(-3, 4) for dy in range(-3, 4)])
+HISTORY_LENGTH = 10
+COOLDOWN = 5
+INF = FIELD_INF
+
+
+def mud_field_offsets(direction):
+    dx, dy = direction
+    offsets = []
+    for depth in range(3):
+        for width in range(-2, 3):
+            offsets.append((dx + width if dx == 0 else dx + depth * dx, dy + width if dy == 0 else dy + depth * dy))
+    return np.array(offsets)
+
+
+MUD_FIELD_OFFSETS = np.stack([mud_field_offsets(DIRECTIONS[name]) for name in DIRECTION_NAMES])
+
+
+def reachable_cells(terrain, starts):
+    passable = PASSABLE[terrain]
+    rows = np.arange(len(terrain))
+    reached = np.zeros(terrain.shape, dtype=bool)
+    reached[rows, starts[:, 0], starts[:, 1]] = True
+    while True:
+        previous = reached.copy()
+        reached[:, 1:] |= reached[:, :-1] & passable[:, 1:]
+        reached[:, :-1] |= reached[:, 1:] & passable[:, :-1]
+        reached[:, :, 1:] |= reached[:, :, :-1] & passable[:, :, 1:]
+        reached[:, :, :-1] |= reached[:, :, 1:] & passable[:, :, :-1]
+        if np.array_equal(reached, previous):
+            return reached
+
+
+def descend(terrain, dist, positions):
+    batch, count, _ = positions.shape
+    width, height = terrain.shape[1:]
+    rows = np.arange(batch)[:, None]
+    cost = STEP_COST[terrain]
+    neighbors = positions[:, :, None, :] + NEIGHBOR_OFFSETS
+    inside = ((neighbors >= 0) & (neighbors < (width, height))).all(axis=3)
+    nx = np.clip(neighbors[..., 0], 0, width - 1)
+    ny = np.clip(neighbors[..., 1], 0, height - 1)
+    values = np.where(inside, np.minimum(dist[rows[:, :, None], nx, ny] + cost[rows[:, :, None], nx, ny], INF), INF)
+    best = np.argmin(values, axis=2)
+    here = dist[rows, positions[..., 0], positions[..., 1]]
+    can_move = (np.take_along_axis(values, best[..., None], axis=2)[..., 0] < INF) & (here > 0) & (here < INF)
+    return np.where(can_move[..., None], positions + NEIGHBOR_OFFSETS[best], positions)
+
+
+class BatchedGameEnvironment:
+    def __init__(self, batch_size, grid_size=GRID_SIZE, enemy_number=ENEMY_NUMBER, max_turns=MAXIUM_TURNS,
+                 regroup_turns=MAX_REGROUP_TURN, drift_threshold=REGROUP_DRIFT, seed=None):
+        self.batch_size = batch_size
+        self.grid_size = grid_size
+        self.enemy_number = enemy_number
+        self.max_turns = max_turns
+        self.regroup_turns = regroup_turns
+        self.drift_threshold = drift_threshold
+        self.rng = np.random.default_rng(seed)
+
+        self.terrain = np.zeros((batch_size, grid_size, grid_size), dtype=np.uint8)
+        self.npc_positions = np.zeros((batch_size, enemy_number, 2), dtype=np.int64)
+        self.enemy_delay = np.zeros((batch_size, enemy_number), dtype=np.int64)
+        self.roles = np.zeros((batch_size, enemy_number), dtype=np.int64)
+        self.labels = np.zeros((batch_size, enemy_number), dtype=np.int64)
+        self.centroids = np.zeros((batch_size, 3, 2), dtype=np.int64)
+        self.cluster_roles = np.zeros((batch_size, 3), dtype=np.int64)
+        self.player_pos = np.zeros((batch_size, 2), dtype=np.int64)
+        self.player_delay = np.zeros(batch_size, dtype=np.int64)
+        self.player_history = np.zeros((batch_size, HISTORY_LENGTH, 2), dtype=np.int64)
+        self.history_length = np.zeros(batch_size, dtype=np.int64)
+        self.point = np.zeros(batch_size, dtype=np.int64)
+        self.remaining_turns = np.zeros(batch_size, dtype=np.int64)
+        self.modify_cooldown = np.zeros(batch_size, dtype=np.int64)
+        self.clear_cooldown = np.zeros(batch_size, dtype=np.int64)
+        self.turn_count = np.zeros(batch_size, dtype=np.int64)
+        self.reset()
+
+    def reset(self, mask=None):
+        games = np.arange(self.batch_size) if mask is None else np.flatnonzero(mask)
+        while len(games):
+            cells = np.argsort(self.rng.random((len(games), self.grid_size * self.grid_size)), axis=1)
+            cells = cells[:, :self.enemy_number + 1]
+            positions = np.stack(np.divmod(cells, self.grid_size), axis=2)
+            terrain = self.rng.choice(len(TERRAIN_PROBABILITIES), size=(len(games), self.grid_size, self.grid_size),
+                                      p=TERRAIN_PROBABILITIES).astype(np.uint8)
+            rows = np.arange(len(games))[:, None]
+            terrain[rows, positions[..., 0], positions[..., 1]] = EMPTY
+            reached = reachable_cells(terrain, positions[:, 0])
+            valid = reached[rows, positions[:, 1:, 0], positions[:, 1:, 1]].all(axis=1)
+
+            accepted = games[valid]
+            self.terrain[accepted] = terrain[valid]
+            self.player_pos[accepted] = positions[valid, 0]
+            self.npc_positions[accepted] = positions[valid, 1:]
+            games = games[~valid]
+
+        games = np.arange(self.batch_size) if mask is None else np.flatnonzero(mask)
+        self.enemy_delay[games] = 0
+        self.player_delay[games] = 0
+        self.history_length[games] = 0
+        self.point[games] = 0
+        self.remaining_turns[games] = self.max_turns
+        self.modify_cooldown[games] = 0
+        self.clear_cooldown[games] = 0
+        self.turn_count[games] = 0
+        self.regroup(games, warm_start=False)
+
+    def regroup(self, games, warm_start=True):
+        if len(games) == 0:
+            return
+        initial = self.centroids[games] if warm_start else None
+        labels, centroids = batch_kmeans_clustering(self.npc_positions[games], initial_centroids=initial, rng=self.rng)
+        self.labels[games] = labels
+        self.centroids[games] = centroids
+        self.cluster_roles[games] = batch_rank_roles(self.player_pos[games], centroids)
+        self.roles[games] = np.take_along_axis(self.cluster_roles[games], labels, axis=1)
+
+    def assign(self, games, agents):
+        nearest = batch_nearest_clusters(self.npc_positions[games], self.centroids[games])
+        labels = np.where(agents, nearest, self.labels[games])
+        self.labels[games] = labels
+        self.roles[games] = np.take_along_axis(self.cluster_roles[games], labels, axis=1)
+
+    def occupancy(self):
+        occupied = np.zeros(self.terrain.shape, dtype=bool)
+        rows = np.arange(self.batch_size)[:, None]
+        occupied[rows, self.npc_positions[..., 0], self.npc_positions[..., 1]] = True
+        return occupied
+
+    def player_tendency(self):
+        count = np.maximum(self.history_length, 1)
+        rows = np.arange(self.batch_size)
+        start = self.player_history[rows, HISTORY_LENGTH - count]
+        end = self.player_history[:, -1]
+        tendency = (end - start) / count[:, None]
+        return np.where((self.history_length > 1)[:, None], tendency, (1.0, 0.0))
+
+    def blocker_target(self, tendency):
+        predicted = np.round(self.player_pos + 7 * tendency).astype(np.int64)
+        return np.clip(predicted, 0, self.grid_size - 1)
+
+    def in_bounds(self, positions):
+        return ((positions >= 0) & (positions < self.grid_size)).all(axis=-1)
+
+    def step(self, moves, mud_directions=None, clears=None):
+        moves = np.asarray(moves)
+        mud_directions = np.full(self.batch_size, -1) if mud_directions is None else np.asarray(mud_directions)
+        clears = np.zeros(self.batch_size, dtype=bool) if clears is None else np.asarray(clears, dtype=bool)
+        previous_point = self.point.copy()
+
+        self.move_player(moves)
+        self.create_mud_field(mud_directions)
+        self.clear_nearby_area(clears)
+        tendency = self.player_tendency()
+        blocker_target = self.blocker_target(tendency)
+        self.update_enemy_position(blocker_target)
+        self.enemy_skill(tendency, blocker_target)
+
+        drifted = batch_drift(self.npc_positions, self.labels, self.centroids) > self.drift_threshold
+        regroup = (self.turn_count >= self.regroup_turns) | drifted
+        self.regroup(np.flatnonzero(regroup))
+        self.turn_count[regroup] = 0
+
+        self.point += 1
+        self.turn_count += 1
+        self.modify_cooldown = np.maximum(0, self.modify_cooldown - 1)
+        self.clear_cooldown = np.maximum(0, self.clear_cooldown - 1)
+        self.remaining_turns = np.maximum(0, self.remaining_turns - 1)
+        return self.point - previous_point, self.remaining_turns == 0
+
+    def move_player(self, moves):
+        games = np.flatnonzero(moves >= 0)
+        self.player_history[games] = np.roll(self.player_history[games], -1, axis=1)
+        self.player_history[games, -1] = self.player_pos[games]
+        self.history_length[games] = np.minimum(self.history_length[games] + 1, HISTORY_LENGTH)
+
+        delayed = self.player_delay[games] > 0
+        self.player_delay[games[delayed]] -= 1
+        games = games[~delayed]
+
+        target = self.player_pos[games] + DIRECTION_OFFSETS[moves[games]]
+        inside = self.in_bounds(target)
+        games, target = games[inside], target[inside]
+        tile = self.terrain[games, target[:, 0], target[:, 1]]
+        walkable = tile != WALL
+        self.player_pos[games[walkable]] = target[walkable]
+        delay = TERRAIN_DELAY[tile]
+        self.player_delay[games[delay > 0]] = delay[delay > 0]
+
+    def create_mud_field(self, mud_directions):
+        games = np.flatnonzero((mud_directions >= 0) & (self.modify_cooldown == 0))
+        if len(games) == 0:
+            return
+        cells = self.player_pos[games, None, :] + MUD_FIELD_OFFSETS[mud_directions[games]]
+        inside = self.in_bounds(cells)
+        rows = np.broadcast_to(games[:, None], inside.shape)[inside]
+        cells = cells[inside]
+        empty = self.terrain[rows, cells[:, 0], cells[:, 1]] == EMPTY
+        rows, cells = rows[empty], cells[empty]
+        self.terrain[rows, cells[:, 0], cells[:, 1]] = MUD
+
+        changed = np.zeros(self.terrain.shape, dtype=bool)
+        changed[rows, cells[:, 0], cells[:, 1]] = True
+        all_rows = np.arange(self.batch_size)[:, None]
+        self.enemy_delay += changed[all_rows, self.npc_positions[..., 0], self.npc_positions[..., 1]]
+        self.modify_cooldown[games] = COOLDOWN
+
+    def clear_nearby_area(self, clears):
+        games = np.flatnonzero(clears & (self.clear_cooldown == 0))
+        if len(games) == 0:
+            return
+        offset = self.npc_positions[games] - self.player_pos[games, None, :]
+        killed = np.zeros((self.batch_size, self.enemy_number), dtype=bool)
+        killed[games] = (np.abs(offset) <= 3).all(axis=2)
+        self.point += 50 * killed.sum(axis=1)
+
+        cells = self.player_pos[games, None, :] + CLEAR_OFFSETS
+        inside = self.in_bounds(cells)
+        rows = np.broadcast_to(games[:, None], inside.shape)[inside]
+        cells = cells[inside]
+        self.terrain[rows, cells[:, 0], cells[:, 1]] = EMPTY
+        self.respawn_enemies(killed)
+        self.clear_cooldown[games] = COOLDOWN
+
+    def respawn_enemies(self, respawn):
+        games = np.flatnonzero(respawn.any(axis=1))
+        if len(games) == 0:
+            return
+        reached = reachable_cells(self.terrain[games], self.player_pos[games])
+        x, y = np.meshgrid(np.arange(self.grid_size), np.arange(self.grid_size), indexing="ij")
+        far = (np.abs(x - self.player_pos[games, 0, None, None]) + np.abs(y - self.player_pos[games, 1, None, None])) > 5
+        candidates = reached & far
+        rows = np.arange(len(games))
+        pending = respawn[games].copy()
+        while pending.any():
+            occupied = self.occupancy()[games]
+            slot = np.argmax(pending, axis=1)
+            active = pending[rows, slot]
+            valid = (candidates & ~occupied).reshape(len(games), -1)
+            choice = np.argmax(self.rng.random(valid.shape) * valid, axis=1)
+            new_position = np.stack(np.divmod(choice, self.grid_size), axis=1)
+            pending[rows[active], slot[active]] = False
+            active &= valid.any(axis=1)
+            game, agent, new_position = games[active], slot[active], new_position[active]
+            self.npc_positions[game, agent] = new_position
+            self.enemy_delay[game, agent] = TERRAIN_DELAY[self.terrain[game, new_position[:, 0], new_position[:, 1]]]
+        self.assign(games, respawn[games])
+
+    def update_enemy_position(self, blocker_target):
+        rows = np.arange(self.batch_size)[:, None]
+        player_dist = distance_fields(self.terrain, self.player_pos)
+        blocker_dist = distance_fields(self.terrain, blocker_target)
+        positions = self.npc_positions
+        is_blocker = self.roles == BLOCKER
+        first = np.where(is_blocker[..., None], descend(self.terrain, blocker_dist, positions),
+                         descend(self.terrain, player_dist, positions))
+        second = np.where(is_blocker[..., None], descend(self.terrain, blocker_dist, first),
+                          descend(self.terrain, player_dist, first))
+
+        first_dist = np.where(is_blocker, blocker_dist[rows, first[..., 0], first[..., 1]],
+                              player_dist[rows, first[..., 0], first[..., 1]])
+        second_dist = player_dist[rows, second[..., 0], second[..., 1]]
+        target = first
+        target = np.where(((self.roles == HELPER) & (second_dist == 0))[..., None], positions, target)
+        target = np.where((is_blocker & (first_dist > 0))[..., None], second, target)
+        delayed = self.enemy_delay > 0
+        target = np.where(delayed[..., None], positions, target)
+
+        cell_count = self.grid_size * self.grid_size
+        moving = (target != positions).any(axis=2)
+        flat_target = target[..., 0] * self.grid_size + target[..., 1]
+        occupied = self.occupancy().reshape(self.batch_size, -1)
+        priority = self.roles * self.enemy_number + np.arange(self.enemy_number)
+        winner = np.full((self.batch_size, cell_count), np.iinfo(np.int64).max)
+        game_index = np.broadcast_to(rows, moving.shape)
+        np.minimum.at(winner, (game_index[moving], flat_target[moving]), priority[moving])
+        allowed = moving & ~occupied[rows, flat_target] & (winner[rows, flat_target] == priority)
+        self.npc_positions = np.where(allowed[..., None], target, positions)
+
+        self.enemy_delay[delayed] -= 1
+        active = ~delayed
+        caught = active & (np.abs(self.npc_positions - self.player_pos[:, None, :]).sum(axis=2) <= 1)
+        self.point -= 100 * caught.sum(axis=1)
+        tile_delay = TERRAIN_DELAY[self.terrain[rows, self.npc_positions[..., 0], self.npc_positions[..., 1]]]
+        update_delay = active & (tile_delay > 0)
+        self.enemy_delay[update_delay] = tile_delay[update_delay]
+        self.respawn_enemies(caught)
+
+    def enemy_skill(self, tendency, blocker_target):
+        occupied = self.occupancy()
+        for agent in range(self.enemy_number):
+            helpers = np.flatnonzero(self.roles[:, agent] == HELPER)
+            if len(helpers):
+                self.helper_skill(helpers, agent, tendency, occupied)
+            blockers = np.flatnonzero(self.roles[:, agent] == BLOCKER)
+            if len(blockers):
+                self.blocker_skill(blockers, agent, blocker_target, occupied)
+
+    def diamond_cells(self, games, centers, occupied):
+        cells = centers[:, None, :] + DIAMOND_OFFSETS
+        inside = self.in_bounds(cells)
+        clipped = np.clip(cells, 0, self.grid_size - 1)
+        tiles = self.terrain[games[:, None], clipped[..., 0], clipped[..., 1]]
+        return cells, inside, tiles, occupied[games[:, None], clipped[..., 0], clipped[..., 1]]
+
+    def helper_skill(self, games, agent, tendency, occupied):
+        helper = self.npc_positions[games, agent]
+        cells, inside, tiles, taken = self.diamond_cells(games, self.player_pos[games], occupied)
+        near = np.abs(cells - helper[:, None, :]).sum(axis=2) <= 5
+        dot = DIAMOND_OFFSETS @ tendency[games].T
+        base = inside & near & ~taken
+
+        set_mud = base & (DIAMOND_DISTANCE >= 4) & (dot.T >= 0) & (tiles == EMPTY)
+        found = set_mud.any(axis=1)
+        best = np.argmin(np.where(set_mud, DIAMOND_DISTANCE, 99), axis=1)
+        target = cells[np.arange(len(games)), best]
+        self.terrain[games[found], target[found, 0], target[found, 1]] = MUD
+        self.enemy_delay[games[found], agent] = 1
+
+        clear = base & (dot.T < 0) & ((tiles == MUD) | (tiles == WATER)) & ~found[:, None]
+        cleared = clear.any(axis=1)
+        best = np.argmin(np.where(clear, DIAMOND_DISTANCE, 99), axis=1)
+        target = cells[np.arange(len(games)), best][cleared]
+        games = games[cleared]
+        tiles = self.terrain[games, target[:, 0], target[:, 1]]
+        self.terrain[games, target[:, 0], target[:, 1]] = np.where(tiles == WATER, MUD, EMPTY)
+
+    def blocker_skill(self, games, agent, blocker_target, occupied):
+        blocker = self.npc_positions[games, agent]
+        cells, inside, tiles, _ = self.diamond_cells(games, blocker_target[games], occupied)
+        near = np.abs(cells - blocker[:, None, :]).sum(axis=2) <= 5
+        candidate = inside & near & (tiles != WALL)
+        score = np.where(candidate, 3 * (tiles == EMPTY) - DIAMOND_DISTANCE, -99)
+        best = np.argmax(score, axis=1)
+        target = cells[np.arange(len(games)), best]
+        act = candidate.any(axis=1) & (target != self.player_pos[games]).any(axis=1)
+        games, target = games[act], target[act]
+        if len(games) == 0:
+            return
+
+        taken = occupied[games, target[:, 0], target[:, 1]]
+        blocked = taken | ~self.ring_connected(games, target)
+        check = np.flatnonzero(blocked & ~taken)
+        if len(check):
+            terrain = self.terrain[games[check]].copy()
+            terrain[np.arange(len(check)), target[check, 0], target[check, 1]] = WALL
+            reached = reachable_cells(terrain, self.player_pos[games[check]])
+            npcs = self.npc_positions[games[check]]
+            blocked[check] = ~reached[np.arange(len(check))[:, None], npcs[..., 0], npcs[..., 1]].all(axis=1)
+        self.terrain[games, target[:, 0], target[:, 1]] = np.where(blocked, EMPTY, WALL)
+        self.enemy_delay[games, agent] = 1
+
+    def ring_connected(self, games, cells):
+        ring = cells[:, None, :] + RING_OFFSETS
+        inside = self.in_bounds(ring)
+        clipped = np.clip(ring, 0, self.grid_size - 1)
+        open_ring = inside & PASSABLE[self.terrain[games[:, None], clipped[..., 0], clipped[..., 1]]]
+        sides = open_ring[:, 0::2]
+        links = sides & open_ring[:, 1::2] & np.roll(sides, -1, axis=1)
+        groups = sides.sum(axis=1) - links.sum(axis=1)
+        return np.maximum(groups, sides.any(axis=1)) <= 1
+
+    def get_state(self):
+        return {
+            "terrain": self.terrain,
+            "player_pos": self.player_pos,
+            "npc_positions": self.npc_positions,
+            "roles": self.roles,
+            "enemy_delay": self.enemy_delay,
+            "player_delay": self.player_delay,
+            "point": self.point,
+            "remaining_turns": self.remaining_turns,
+            "modify_cooldown": self.modify_cooldown,
+            "clear_cooldown": self.clear_cooldown
+        }
@@ -0,0 +1,249 @@
+import argparse
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+
+import numpy as np
+
+from connectivity import ConnectivityIndex
+from cooperative_astar import SearchContext, astar_search, cooperative_astar, create_hierarchical_fields
+from agents import HELPER, BLOCKER
+from main import GameEnvironment
+from npc_clustering import kmeans_clustering, cluster_npc_groups
+from terrain import EMPTY, WALL, random_terrain
+
+SIZES = (30, 128, 512)
+AGENT_COUNTS = (20, 100, 500)
+CLUSTER_COUNTS = (20, 200, 2000)
+SEED = 1234
+
+
+def seed_everything(seed=SEED):
+    random.seed(seed)
+    np.random.seed(seed)
+
+
+def random_map(size):
+    grid = random_terrain((size, size))
+    grid[0, 0] = grid[size - 1, size - 1] = EMPTY
+    return grid
+
+
+def serpentine_map(size):
+    grid = np.full((size, size), EMPTY, dtype=np.uint8)
+    for x in range(1, size - 1, 2):
+        grid[x, :] = WALL
+        gap = size - 1 if (x // 2) % 2 == 0 else 0
+        grid[x, gap] = EMPTY
+    return grid
+
+
+def random_agents(grid, count):
+    free = np.argwhere(grid != WALL)
+    chosen = free[np.random.choice(len(free), size=min(count, len(free) - 1), replace=False)]
+    return [tuple(int(c) for c in cell) for cell in chosen]
+
+
+def game_for(size):
+    seed_everything()
+    return GameEnvironment(grid_size=size)
+
+
+def bench_astar_random(size):
+    grid = random_map(size)
+    return lambda: astar_search(grid, (0, 0), (size - 1, size - 1))
+
+
+def bench_astar_adversarial(size):
+    grid = serpentine_map(size)
+    return lambda: astar_search(grid, (0, 0), (size - 1, size - 1))
+
+
+def bench_astar_reused(size):
+    grid = random_map(size)
+    context = SearchContext(grid)
+    return lambda: astar_search(grid, (0, 0), (size - 1, size - 1), context=context)
+
+
+def bench_cooperative_astar(count):
+    def factory(size):
+        grid = random_map(size)
+        agents = random_agents(grid, count + 1)
+        player, npcs = agents[0], agents[1:]
+        clusters = cluster_npc_groups(player, npcs, seed=SEED)
+        blocker_target = (min(size - 1, player[0] + 7), player[1])
+        return lambda: cooperative_astar(grid, npcs, clusters, player, blocker_target)
+    return factory
+
+
+def bench_hierarchical_astar(count):
+    def factory(size):
+        grid = random_map(size)
+        agents = random_agents(grid, count + 2)
+        players, npcs = agents[:2], agents[2:]
+        clusters = cluster_npc_groups(players[0], npcs, seed=SEED)
+        fields = create_hierarchical_fields(grid)
+        turn = [0]
+
+        def run():
+            turn[0] += 1
+            player = players[turn[0] % 2]
+            blocker_target = (min(size - 1, player[0] + 7), player[1])
+            return cooperative_astar(grid, npcs, clusters, player, blocker_target, fields=fields)
+        return run
+    return factory
+
+
+def bench_kmeans(count):
+    def factory(size):
+        points = [tuple(int(c) for c in point) for point in np.random.randint(0, size, (count, 2))]
+        return lambda: kmeans_clustering(points, seed=SEED)
+    return factory
+
+
+def bench_is_map_valid(size):
+    game = game_for(size)
+    grid = np.asarray(game.grid).copy()
+    return lambda: game.is_map_valid(grid, game.player_pos, game.npc_positions)
+
+
+def bench_connectivity_index(size):
+    grid = random_map(size)
+    return lambda: ConnectivityIndex(grid, watch=False)
+
+
+def bench_generate_map(size):
+    game = game_for(size)
+    return game.generate_map
+
+
+def bench_helper_skill(size):
+    game = game_for(size)
+
+    def run():
+        for agent in game.agents.with_role(HELPER):
+            game.helper_skill(agent, game.player_tendency)
+    return run
+
+
+def bench_blocker_skill(size):
+    game = game_for(size)
+    blocker_target = game.get_blocker_target()
+
+    def run():
+        for agent in game.agents.with_role(BLOCKER):
+            game.blocker_skill(agent, blocker_target, game.player_tendency)
+    return run
+
+
+def bench_tick(size):
+    game = game_for(size)
+
+    def run():
+        game.update_enemy_position()
+        game.enemy_skill()
+    return run
+
+
+CASES = {
+    "astar_search/random": bench_astar_random,
+    "astar_search/adversarial": bench_astar_adversarial,
+    "astar_search/reused": bench_astar_reused,
+    **{f"cooperative_astar/{count}": bench_cooperative_astar(count) for count in AGENT_COUNTS},
+    **{f"hierarchical_astar/{count}": bench_hierarchical_astar(count) for count in AGENT_COUNTS},
+    **{f"kmeans_clustering/{count}": bench_kmeans(count) for count in CLUSTER_COUNTS},
+    "is_map_valid": bench_is_map_valid,
+    "connectivity_index": bench_connectivity_index,
+    "generate_map": bench_generate_map,
+    "helper_skill": bench_helper_skill,
+    "blocker_skill": bench_blocker_skill,
+    "tick": bench_tick,
+}
+
+
+def measure(factory, size, repeat, budget):
+    seed_everything()
+    run = factory(size)
+    seed_everything()
+    run()
+    times = []
+    started = time.perf_counter()
+    while len(times) < repeat and (not times or time.perf_counter() - started < budget):
+        before = time.perf_counter()
+        run()
+        times.append(1000 * (time.perf_counter() - before))
+    return {
+        "runs": len(times),
+        "min_ms": min(times),
+        "median_ms": statistics.median(times),
+        "mean_ms": statistics.fmean(times)
+    }
+
+
+def run_suite(sizes, repeat, budget, only=None):
+    results = {}
+    for size in sizes:
+        for name, factory in CASES.items():
+            if only and not any(pattern in name for pattern in only):
+                continue
+            key = f"{name}@{size}"
+            results[key] = measure(factory, size, repeat, budget)
+            print(f"{key:40s} {results[key]['median_ms']:12.3f} ms  ({results[key]['runs']} runs)", flush=True)
+    return results
+
+
+def compare(baseline, current, threshold):
+    regressions = []
+    for key, result in current.items():
+        if key not in baseline:
+            continue
+        before, after = baseline[key]["median_ms"], result["median_ms"]
+        ratio = after / before if before > 0 else float("inf")
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "REGRESSION"
+            regressions.append(key)
+        elif ratio < 1 - threshold:
+            flag = "improved"
+        print(f"{key:40s} {before:12.3f} -> {after:12.3f} ms  x{ratio:6.2f}  {flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the pathfinding, clustering, map and tick hot paths.")
+    parser.add_argument("--sizes", type=lambda text: [int(size) for size in text.split(",")], default=list(SIZES))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=10.0, help="seconds per case before repeats are cut short")
+    parser.add_argument("--only", nargs="*", help="run only cases whose name contains one of these strings")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="saved results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative slowdown reported as a regression")
+    args = parser.parse_args()
+
+    results = run_suite(args.sizes, args.repeat, args.budget, args.only)
+    with open(args.output, "w") as output_file:
+        json.dump({
+            "meta": {
+                "python": platform.python_version(),
+                "numpy": np.__version__,
+                "machine": platform.platform(),
+                "seed": SEED,
+                "repeat": args.repeat
+            },
+            "results": results
+        }, output_file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)["results"]
+        regressions = compare(baseline, results, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) above {args.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
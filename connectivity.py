@@ -0,0 +1,230 @@
+import copy
+from collections import deque
+
+import numpy as np
+
+from terrain import PASSABLE, encode_terrain
+
+RING = [(0, -1), (1, -1), (1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1)]
+
+
+class ConnectivityIndex:
+    def __init__(self, grid, watch=True):
+        self.grid = grid
+        self.width, self.height = grid.shape
+        size = self.width * self.height
+        self.passable = PASSABLE[encode_terrain(grid)].ravel().tolist()
+        self.labels = [-1] * size
+        self.sizes = {}
+        self.next_label = 0
+        self.shared = False
+        for index in range(size):
+            if self.passable[index] and self.labels[index] < 0:
+                label = self.new_label()
+                self.sizes[label] = self.flood([index], label)
+        if watch and hasattr(grid, "add_listener"):
+            grid.add_listener(self.notify)
+
+    def copy(self, grid):
+        clone = copy.copy(self)
+        clone.grid = grid
+        self.shared = clone.shared = True
+        if hasattr(grid, "add_listener"):
+            grid.add_listener(clone.notify)
+        return clone
+
+    def detach(self):
+        if hasattr(self.grid, "remove_listener"):
+            self.grid.remove_listener(self.notify)
+
+    def index(self, pos):
+        return pos[0] * self.height + pos[1]
+
+    def new_label(self):
+        self.next_label += 1
+        return self.next_label - 1
+
+    def neighbors(self, index):
+        x, y = divmod(index, self.height)
+        height = self.height
+        neighbors = []
+        if x > 0:
+            neighbors.append(index - height)
+        if x < self.width - 1:
+            neighbors.append(index + height)
+        if y > 0:
+            neighbors.append(index - 1)
+        if y < height - 1:
+            neighbors.append(index + 1)
+        return [n for n in neighbors if self.passable[n]]
+
+    def flood(self, seeds, label):
+        labels = self.labels
+        queue = deque(seeds)
+        for seed in seeds:
+            labels[seed] = label
+        count = len(seeds)
+        while queue:
+            current = queue.popleft()
+            for neighbor in self.neighbors(current):
+                if labels[neighbor] != label:
+                    labels[neighbor] = label
+                    queue.append(neighbor)
+                    count += 1
+        return count
+
+    def label(self, pos):
+        if not (0 <= pos[0] < self.width and 0 <= pos[1] < self.height):
+            return -1
+        return self.labels[self.index(pos)]
+
+    def connected(self, a, b):
+        label = self.label(a)
+        return label >= 0 and label == self.label(b)
+
+    def all_reachable(self, start, positions):
+        label = self.label(start)
+        return label >= 0 and all(self.label(pos) == label for pos in positions)
+
+    def notify(self, cells):
+        cells_view = np.asarray(self.grid)
+        for x, y in cells:
+            index = self.index((x, y))
+            passable = bool(PASSABLE[cells_view[x, y]])
+            if passable == self.passable[index]:
+                continue
+            self.own()
+            if passable:
+                self.add_cell(index)
+            else:
+                self.remove_cell(index)
+
+    def own(self):
+        if self.shared:
+            self.passable = list(self.passable)
+            self.labels = list(self.labels)
+            self.sizes = dict(self.sizes)
+            self.shared = False
+
+    def add_cell(self, index):
+        self.passable[index] = True
+        neighbor_labels = {self.labels[n] for n in self.neighbors(index)}
+        if not neighbor_labels:
+            self.labels[index] = self.new_label()
+            self.sizes[self.labels[index]] = 1
+            return
+        keep = max(neighbor_labels, key=lambda label: self.sizes.get(label, 0))
+        self.labels[index] = keep
+        self.sizes[keep] += 1
+        for neighbor in self.neighbors(index):
+            if self.labels[neighbor] != keep:
+                self.sizes.pop(self.labels[neighbor], None)
+                self.sizes[keep] += self.flood([neighbor], keep)
+
+    def remove_cell(self, index):
+        label = self.labels[index]
+        groups, live = self.split_groups(index)
+        self.passable[index] = False
+        self.labels[index] = -1
+        self.sizes[label] -= 1
+        if live is None and groups:
+            live = max(groups, key=lambda root: len(groups[root]))
+        for root, members in groups.items():
+            if root != live:
+                new_label = self.new_label()
+                for member in members:
+                    self.labels[member] = new_label
+                self.sizes[new_label] = len(members)
+                self.sizes[label] -= len(members)
+
+    def ring_connected(self, index):
+        x, y = divmod(index, self.height)
+        ring = []
+        for dx, dy in RING:
+            nx, ny = x + dx, y + dy
+            ring.append(0 <= nx < self.width and 0 <= ny < self.height and self.passable[nx * self.height + ny])
+        if all(ring):
+            return True
+        start = ring.index(False)
+        runs = 0
+        in_run = False
+        has_neighbor = False
+        for offset in range(1, 9):
+            position = (start + offset) % 8
+            if ring[position]:
+                in_run = True
+                has_neighbor = has_neighbor or position % 2 == 0
+            elif in_run:
+                runs += has_neighbor
+                in_run = False
+                has_neighbor = False
+        return runs <= 1
+
+    def split_groups(self, index):
+        seeds = self.neighbors(index)
+        if len(seeds) <= 1 or self.ring_connected(index):
+            return {}, None
+
+        parent = list(range(len(seeds)))
+
+        def find(group):
+            while parent[group] != group:
+                group = parent[group]
+            return group
+
+        owner = {index: -1}
+        frontiers = {}
+        members = {}
+        for group, seed in enumerate(seeds):
+            owner[seed] = group
+            frontiers[group] = deque([seed])
+            members[group] = [seed]
+
+        while True:
+            roots = [group for group in frontiers if find(group) == group]
+            if len(roots) == 1:
+                return {}, None
+            live = [root for root in roots if frontiers[root]]
+            if len(live) <= 1:
+                exhausted = {root: members[root] for root in roots if not frontiers[root]}
+                return exhausted, (live[0] if live else None)
+
+            for root in live:
+                if find(root) != root or not frontiers[root]:
+                    continue
+                current = frontiers[root].popleft()
+                for neighbor in self.neighbors(current):
+                    other = owner.get(neighbor)
+                    if other is None:
+                        owner[neighbor] = root
+                        frontiers[root].append(neighbor)
+                        members[root].append(neighbor)
+                    elif other >= 0 and find(other) != root:
+                        other = find(other)
+                        parent[other] = root
+                        frontiers[root].extend(frontiers.pop(other))
+                        members[root].extend(members.pop(other))
+
+    def would_disconnect(self, pos, start, positions):
+        if not self.all_reachable(start, positions):
+            return True
+        index = self.index(pos)
+        if not self.passable[index]:
+            return False
+        if pos == start or pos in positions:
+            return True
+
+        groups, live = self.split_groups(index)
+        if not groups:
+            return False
+        pockets = {root: set(members) for root, members in groups.items()}
+
+        def side(cell):
+            cell_index = self.index(cell)
+            for root, members in pockets.items():
+                if cell_index in members:
+                    return root
+            return live
+
+        start_side = side(start)
+        return any(side(npc) != start_side for npc in positions)
@@ -1,51 +1,142 @@
 import heapq
 
-def astar_search(grid, start, goal):
-    open_set = []
-    heapq.heappush(open_set, (0, start))
-    came_from = {}
-    g_score = {start: 0}
-    f_score = {start: heuristic(start, goal)}
-    
+import numpy as np
+
+from distance_field import DistanceField, IncrementalDistanceField
+from hpa import HierarchicalField, HierarchicalPlanner, SECTOR_SIZE, SEARCH_BUDGET
+from reservation_table import ReservedPath, windowed_astar
+from terrain import PASSABLE, TERRAIN_COST, encode_terrain
+
+BLOCKED = 0
+NO_PARENT = -1
+STEP_COSTS = np.where(PASSABLE, TERRAIN_COST, BLOCKED).astype(np.int64).tolist()
+CONTEXTS = {}
+
+class SearchContext:
+    def __init__(self, grid=None):
+        self.shape = None
+        self.generation = 0
+        if grid is not None:
+            self.bind(grid)
+
+    def bind(self, grid):
+        cells = np.ascontiguousarray(encode_terrain(grid))
+        if cells.shape != self.shape:
+            width, height = self.shape = cells.shape
+            self.steps = ((-1, 0, -height), (1, 0, height), (0, -1, -1), (0, 1, 1))
+            self.g = [0] * cells.size
+            self.parent = [NO_PARENT] * cells.size
+            self.seen = [0] * cells.size
+            self.closed = [0] * cells.size
+            self.generation = 0
+        self.cells = memoryview(cells.reshape(-1))
+        return self
+
+    def reset(self):
+        self.generation += 1
+        return self.generation
+
+def search_context(grid):
+    shape = np.shape(grid)
+    if shape not in CONTEXTS:
+        CONTEXTS[shape] = SearchContext()
+    return CONTEXTS[shape].bind(grid)
+
+def astar_search(grid, start, goal, stats=None, context=None):
+    if context is None:
+        context = search_context(grid)
+    generation = context.reset()
+    cells, g, parent, seen, closed = context.cells, context.g, context.parent, context.seen, context.closed
+    width, height = context.shape
+    size = width * height
+    goal_x, goal_y = goal
+    start_index = start[0] * height + start[1]
+    goal_index = goal_x * height + goal_y
+    g[start_index] = 0
+    parent[start_index] = NO_PARENT
+    seen[start_index] = generation
+    open_set = [(abs(start[0] - goal_x) + abs(start[1] - goal_y)) * size + start_index]
+    expanded = stale_pops = 0
+    pushes = 1
+    path = None
+
     while open_set:
-        _, current = heapq.heappop(open_set)
-        if current == goal:
-            return reconstruct_path(came_from, current)
-        
-        for neighbor in get_neighbors(grid, current):
-            terrain_cost = get_terrain_cost(grid, neighbor)
-            tentative_g_score = g_score[current] + terrain_cost
-            if neighbor not in g_score or tentative_g_score < g_score[neighbor]:
-                came_from[neighbor] = current
-                g_score[neighbor] = tentative_g_score
-                f_score[neighbor] = tentative_g_score + heuristic(neighbor, goal)
-                heapq.heappush(open_set, (f_score[neighbor], neighbor))
-    return []
-
-def heuristic(a, b):
-    return abs(a[0] - b[0]) + abs(a[1] - b[1])
-
-def get_neighbors(grid, node):
-    x, y = node
-    neighbors = []
-    for dx, dy in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
-        nx, ny = x + dx, y + dy
-        if 0 <= nx < len(grid) and 0 <= ny < len(grid[0]) and grid[nx][ny] != "wall":
-            neighbors.append((nx, ny))
-    return neighbors
-
-def get_terrain_cost(grid, pos):
-    terrain_weights = {"empty": 1, "mud": 2, "water": 3, "wall": float("inf")}
-    return terrain_weights.get(grid[pos[0]][pos[1]], 1)
-
-def reconstruct_path(came_from, current):
-    path = []
-    while current in came_from:
-        path.append(current)
-        current = came_from[current]
-    return path[::-1]
-
-def cooperative_astar(grid, npc_positions, clustered_npcs, player_position, blocker_target):
+        current = heapq.heappop(open_set) % size
+        if closed[current] == generation:
+            stale_pops += 1
+            continue
+        closed[current] = generation
+        expanded += 1
+        if current == goal_index:
+            path = []
+            while current != start_index:
+                path.append(divmod(current, height))
+                current = parent[current]
+            path.reverse()
+            break
+
+        x, y = divmod(current, height)
+        current_g = g[current]
+        for dx, dy, step in context.steps:
+            nx, ny = x + dx, y + dy
+            if not (0 <= nx < width and 0 <= ny < height):
+                continue
+            neighbor = current + step
+            cost = STEP_COSTS[cells[neighbor]]
+            if cost == BLOCKED or closed[neighbor] == generation:
+                continue
+            tentative_g_score = current_g + cost
+            if seen[neighbor] != generation or tentative_g_score < g[neighbor]:
+                seen[neighbor] = generation
+                g[neighbor] = tentative_g_score
+                parent[neighbor] = current
+                heapq.heappush(open_set, (tentative_g_score + abs(nx - goal_x) + abs(ny - goal_y)) * size + neighbor)
+                pushes += 1
+
+    if stats is not None:
+        stats.expanded += expanded
+        stats.pushes += pushes
+        stats.stale_pops += stale_pops
+        stats.finish(path or [], path is None)
+    return path or []
+
+HIERARCHICAL_GRID_SIZE = 128
+
+def create_incremental_fields(grid):
+    player_field = IncrementalDistanceField(grid)
+    return {"chaser": player_field, "helper": player_field, "blocker": IncrementalDistanceField(grid)}
+
+def create_hierarchical_fields(grid, sector_size=SECTOR_SIZE, budget=SEARCH_BUDGET):
+    planner = HierarchicalPlanner(grid, sector_size)
+    player_field = planner.field(budget=budget)
+    return {"chaser": player_field, "helper": player_field, "blocker": planner.field(budget=budget)}
+
+def create_path_fields(grid):
+    if max(grid.shape) >= HIERARCHICAL_GRID_SIZE:
+        return create_hierarchical_fields(grid)
+    return create_incremental_fields(grid)
+
+def copy_path_fields(fields, grid):
+    copies = {}
+    planners = {}
+    for field in fields.values():
+        if id(field) in copies:
+            continue
+        if isinstance(field, HierarchicalField):
+            if id(field.planner) not in planners:
+                planners[id(field.planner)] = field.planner.copy(grid)
+            copies[id(field)] = field.copy(planners[id(field.planner)])
+        else:
+            copies[id(field)] = field.copy(grid)
+    return {name: copies[id(field)] for name, field in fields.items()}
+
+def detach_path_fields(fields):
+    for field in fields.values():
+        (field.planner if isinstance(field, HierarchicalField) else field).detach()
+
+def cooperative_astar(grid, npc_positions, clustered_npcs, player_position, blocker_target, use_distance_field=True, fields=None, reservations=None, delays=None, stats=None, scheduler=None):
+    grid = encode_terrain(grid)
+    context = None
     planned_paths = {}
     occupied_positions = set(npc_positions)
     target_positions = {
@@ -53,20 +144,54 @@ def cooperative_astar(grid, npc_positions, clustered_npcs, player_position, bloc
         "helper": player_position,
         "blocker": blocker_target
     }
+    if fields is not None:
+        updates = {}
+        for group_name, npc_group in clustered_npcs.items():
+            field = fields[group_name]
+            updates.setdefault(id(field), (field, target_positions[group_name], []))[2].extend(npc_group)
+        for field, target, npcs in updates.values():
+            field.update(target, npcs)
+    elif use_distance_field or reservations is not None:
+        shared_fields = {}
+        for group_name, npc_group in clustered_npcs.items():
+            shared_fields.setdefault(target_positions[group_name], []).extend(npc_group)
+        shared_fields = {target: DistanceField(grid, target, npcs) for target, npcs in shared_fields.items()}
+        fields = {group_name: shared_fields[target_positions[group_name]] for group_name in clustered_npcs}
+
+    if reservations is not None:
+        delays = dict(zip(npc_positions, delays)) if delays is not None else {}
+        reservations.begin_tick(npc_positions, clustered_npcs, target_positions, delays, keep_stale=scheduler is not None)
+        if scheduler is not None:
+            return scheduler.plan(grid, clustered_npcs, target_positions, fields, reservations, delays, occupied_positions, stats)
+
     for group_name, npc_group in clustered_npcs.items():
+        target = target_positions[group_name]
+        counters = stats.role(group_name) if stats is not None else None
         for npc in npc_group:
-            if npc in target_positions[group_name]:
+            if reservations is not None:
+                planned_paths[npc] = reserved_next_position(grid, npc, group_name, target, fields[group_name], reservations, delays, occupied_positions, counters)
+                continue
+
+            if npc == target:
                 planned_paths[npc] = npc
                 continue
 
-            path = astar_search(grid, npc, target_positions[group_name]) 
+            if fields is not None:
+                path = fields[group_name].path(npc, 3)
+                if counters is not None:
+                    counters.finish(path)
+            else:
+                if context is None:
+                    context = search_context(grid)
+                path = astar_search(grid, npc, target, counters, context)
+            path_length = len(path)
             if not path:
                 planned_paths[npc] = npc
                 continue
   
-            if group_name == "helper" and len(path) < 3:
+            if group_name == "helper" and path_length < 3:
                 next_pos = npc
-            elif group_name == "blocker" and len(path) >= 2:
+            elif group_name == "blocker" and path_length >= 2:
                 next_pos = path[1]
             else:
                 next_pos = path[0]
@@ -77,3 +202,23 @@ def cooperative_astar(grid, npc_positions, clustered_npcs, player_position, bloc
             else:
                 planned_paths[npc] = npc
     return planned_paths
+
+def reserved_next_position(grid, npc, group_name, target, field, reservations, delays, occupied_positions, stats=None):
+    path = reservations.path_for(npc)
+    if path is None:
+        if group_name == "helper":
+            reached = lambda pos: len(field.path(pos, 3)) < 3
+        else:
+            reached = lambda pos: pos == target
+        stride = 2 if group_name == "blocker" else 1
+        cells = windowed_astar(grid, npc, delays.get(npc, 0), field, reached, reservations, stride, stats)
+        path = ReservedPath(cells, reservations.time, group_name, target)
+        reservations.reserve(npc, path)
+
+    remaining = path.remaining(reservations.time)
+    next_pos = remaining[1] if len(remaining) > 1 else npc
+    if next_pos != npc and next_pos in occupied_positions:
+        reservations.release(npc)
+        return npc
+    occupied_positions.add(next_pos)
+    return next_pos
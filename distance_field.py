@@ -0,0 +1,307 @@
+import copy
+import heapq
+
+import numpy as np
+
+from terrain import TERRAIN_COST, TERRAIN_COST_LIST, PASSABLE, encode_terrain
+
+INF = float("inf")
+FIELD_INF = np.iinfo(np.int32).max // 2
+STEP_COST = np.where(np.isfinite(TERRAIN_COST), TERRAIN_COST, FIELD_INF).astype(np.int32)
+
+
+class DistanceField:
+    def __init__(self, grid, goal, targets=()):
+        grid = encode_terrain(grid)
+        self.width, self.height = grid.shape
+        self.goal = goal
+        size = self.width * self.height
+        self.cost = TERRAIN_COST[grid].ravel().tolist()
+        self.dist = [INF] * size
+        self.steps = [-1] * size
+        self.next_cell = [-1] * size
+        self.closed = bytearray(size)
+        self.open_set = []
+
+        if self.in_bounds(goal) and self.cost[self.index(goal)] != INF:
+            start = self.index(goal)
+            self.dist[start] = 0
+            self.steps[start] = 0
+            self.open_set.append((0, start))
+        self.settle_all(targets)
+
+    def in_bounds(self, pos):
+        return 0 <= pos[0] < self.width and 0 <= pos[1] < self.height
+
+    def index(self, pos):
+        return pos[0] * self.height + pos[1]
+
+    def position(self, index):
+        return divmod(index, self.height)
+
+    def settle_all(self, targets):
+        pending = {self.index(pos) for pos in targets if self.in_bounds(pos)}
+        self.expand_until(pending)
+
+    def settle(self, index):
+        if not self.closed[index]:
+            self.expand_until({index})
+
+    def expand_until(self, pending):
+        closed, dist, steps, next_cell, cost = self.closed, self.dist, self.steps, self.next_cell, self.cost
+        open_set, width, height = self.open_set, self.width, self.height
+        pending = {i for i in pending if not closed[i]}
+        while pending and open_set:
+            current_dist, current = heapq.heappop(open_set)
+            if closed[current] or current_dist > dist[current]:
+                continue
+            closed[current] = 1
+            pending.discard(current)
+
+            x, y = divmod(current, height)
+            step_cost = current_dist + cost[current]
+            step_count = steps[current] + 1
+            for neighbor, valid in ((current - height, x > 0), (current + height, x < width - 1),
+                                    (current - 1, y > 0), (current + 1, y < height - 1)):
+                if valid and step_cost < dist[neighbor] and cost[neighbor] != INF and not closed[neighbor]:
+                    dist[neighbor] = step_cost
+                    steps[neighbor] = step_count
+                    next_cell[neighbor] = current
+                    heapq.heappush(open_set, (step_cost, neighbor))
+
+    def distance(self, pos):
+        if not self.in_bounds(pos):
+            return INF
+        index = self.index(pos)
+        self.settle(index)
+        return self.dist[index] if self.closed[index] else INF
+
+    def path_length(self, pos):
+        if self.distance(pos) == INF:
+            return 0
+        return self.steps[self.index(pos)]
+
+    def next_step(self, pos):
+        if self.distance(pos) == INF or pos == self.goal:
+            return None
+        return self.position(self.next_cell[self.index(pos)])
+
+    def path(self, pos, max_steps=None):
+        path = []
+        current = self.next_step(pos)
+        while current is not None and (max_steps is None or len(path) < max_steps):
+            path.append(current)
+            current = self.next_step(current)
+        return path
+
+
+class IncrementalDistanceField:
+    def __init__(self, grid, goal=None):
+        self.grid = grid
+        self.width, self.height = grid.shape
+        self.goal = goal
+        self.reset()
+        if hasattr(grid, "add_listener"):
+            grid.add_listener(self.notify)
+
+    def copy(self, grid):
+        clone = copy.copy(self)
+        clone.grid = grid
+        clone.cost = list(self.cost)
+        clone.g = list(self.g)
+        clone.rhs = list(self.rhs)
+        clone.open_set = list(self.open_set)
+        clone.changed_cells = list(self.changed_cells)
+        if hasattr(grid, "add_listener"):
+            grid.add_listener(clone.notify)
+        return clone
+
+    def detach(self):
+        if hasattr(self.grid, "remove_listener"):
+            self.grid.remove_listener(self.notify)
+
+    def in_bounds(self, pos):
+        return 0 <= pos[0] < self.width and 0 <= pos[1] < self.height
+
+    def index(self, pos):
+        return pos[0] * self.height + pos[1]
+
+    def position(self, index):
+        return divmod(index, self.height)
+
+    def neighbors(self, index):
+        x, y = divmod(index, self.height)
+        height = self.height
+        neighbors = []
+        if x > 0:
+            neighbors.append(index - height)
+        if x < self.width - 1:
+            neighbors.append(index + height)
+        if y > 0:
+            neighbors.append(index - 1)
+        if y < height - 1:
+            neighbors.append(index + 1)
+        return neighbors
+
+    def reset(self):
+        size = self.width * self.height
+        self.cost = TERRAIN_COST[np.asarray(self.grid)].ravel().tolist()
+        self.g = [INF] * size
+        self.rhs = [INF] * size
+        self.open_set = []
+        self.changed_cells = []
+        self.goal_index = -1
+        if self.goal is not None and self.in_bounds(self.goal):
+            self.goal_index = self.index(self.goal)
+            self.update_vertex(self.goal_index)
+
+    def notify(self, cells):
+        self.changed_cells.extend(cells)
+
+    def update(self, goal, targets=()):
+        if goal != self.goal:
+            self.goal = goal
+            self.reroot(targets)
+        elif self.changed_cells:
+            self.apply_changes()
+        self.settle_all(targets)
+        return self
+
+    def apply_changes(self, repair=True):
+        cells = np.asarray(self.grid)
+        for x, y in set(self.changed_cells):
+            index = self.index((x, y))
+            cost = TERRAIN_COST_LIST[cells[x, y]]
+            if cost == self.cost[index]:
+                continue
+            self.cost[index] = cost
+            if repair:
+                self.update_vertex(index)
+                for neighbor in self.neighbors(index):
+                    self.update_vertex(neighbor)
+        self.changed_cells = []
+
+    def reroot(self, targets):
+        self.apply_changes(repair=False)
+        size = self.width * self.height
+        cost = self.cost
+        g = self.g = [INF] * size
+        rhs = self.rhs = [INF] * size
+        open_set = self.open_set = []
+        self.goal_index = -1
+        if self.goal is None or not self.in_bounds(self.goal):
+            return
+        self.goal_index = self.index(self.goal)
+        if cost[self.goal_index] == INF:
+            return
+        rhs[self.goal_index] = 0
+        open_set.append((0, self.goal_index))
+        pending = {self.index(pos) for pos in targets if self.in_bounds(pos)}
+        while pending and open_set:
+            key, current = heapq.heappop(open_set)
+            if g[current] == rhs[current] or key != rhs[current]:
+                continue
+            g[current] = key
+            pending.discard(current)
+            step_cost = key + cost[current]
+            for neighbor in self.neighbors(current):
+                if step_cost < rhs[neighbor] and cost[neighbor] != INF:
+                    rhs[neighbor] = step_cost
+                    heapq.heappush(open_set, (step_cost, neighbor))
+
+    def update_vertex(self, index):
+        cost, g = self.cost, self.g
+        if cost[index] == INF:
+            rhs = INF
+        elif index == self.goal_index:
+            rhs = 0
+        else:
+            rhs = min((cost[n] + g[n] for n in self.neighbors(index)), default=INF)
+        self.rhs[index] = rhs
+        if g[index] != rhs:
+            heapq.heappush(self.open_set, (min(g[index], rhs), index))
+
+    def settle_all(self, targets):
+        for pos in targets:
+            if self.in_bounds(pos):
+                self.settle(self.index(pos))
+
+    def settle(self, index):
+        g, rhs, cost, open_set = self.g, self.rhs, self.cost, self.open_set
+        while open_set:
+            if g[index] == rhs[index] and open_set[0][0] >= g[index]:
+                break
+            key, current = heapq.heappop(open_set)
+            if g[current] == rhs[current] or key != min(g[current], rhs[current]):
+                continue
+            if g[current] > rhs[current]:
+                g[current] = rhs[current]
+                step_cost = g[current] + cost[current]
+                for neighbor in self.neighbors(current):
+                    if step_cost < rhs[neighbor] and cost[neighbor] != INF:
+                        rhs[neighbor] = step_cost
+                        if g[neighbor] != step_cost:
+                            heapq.heappush(open_set, (min(g[neighbor], step_cost), neighbor))
+            else:
+                g[current] = INF
+                self.update_vertex(current)
+                for neighbor in self.neighbors(current):
+                    self.update_vertex(neighbor)
+
+    def distance(self, pos):
+        if not self.in_bounds(pos):
+            return INF
+        index = self.index(pos)
+        self.settle(index)
+        return self.g[index]
+
+    def next_step(self, pos):
+        if self.distance(pos) == INF or pos == self.goal:
+            return None
+        cost, g = self.cost, self.g
+        best = min(self.neighbors(self.index(pos)), key=lambda n: cost[n] + g[n])
+        return self.position(best)
+
+    def path(self, pos, max_steps=None):
+        path = []
+        current = self.next_step(pos)
+        while current is not None and (max_steps is None or len(path) < max_steps):
+            path.append(current)
+            current = self.next_step(current)
+        return path
+
+
+def sweep(dist, cost):
+    entered = dist + cost
+    for x in range(len(dist) - 2, -1, -1):
+        np.minimum(dist[x], entered[x + 1], out=dist[x])
+        np.add(dist[x], cost[x], out=entered[x])
+    for x in range(1, len(dist)):
+        np.minimum(dist[x], entered[x - 1], out=dist[x])
+        np.add(dist[x], cost[x], out=entered[x])
+
+
+def relax(dist, cost):
+    rows = np.ascontiguousarray(dist.transpose(1, 0, 2))
+    sweep(rows, np.ascontiguousarray(cost.transpose(1, 0, 2)))
+    columns = np.ascontiguousarray(rows.transpose(2, 1, 0))
+    sweep(columns, np.ascontiguousarray(cost.transpose(2, 0, 1)))
+    dist[...] = columns.transpose(1, 2, 0)
+
+
+def distance_fields(terrain, goals):
+    cost = STEP_COST[terrain]
+    rows = np.arange(len(terrain))
+    passable = PASSABLE[terrain]
+    goal_passable = passable[rows, goals[:, 0], goals[:, 1]]
+    dist = np.full(terrain.shape, FIELD_INF, dtype=np.int32)
+    dist[rows[goal_passable], goals[goal_passable, 0], goals[goal_passable, 1]] = 0
+    active = rows[goal_passable]
+    while len(active):
+        field = dist[active]
+        previous = field.copy()
+        relax(field, cost[active])
+        dist[active] = field
+        active = active[(field != previous).any(axis=(1, 2))]
+    dist[~passable] = FIELD_INF
+    return dist
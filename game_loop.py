@@ -0,0 +1,97 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pygame
+
+from pygame_running_and_display import handle_events, update_screen, show_game_over_screen, quit_game
+from settings import GAME_SPEED
+from terrain import TerrainGrid
+
+FRAME_RATE = 60
+
+
+class TickInput:
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.move = None
+        self.mud_direction = None
+        self.clear_area = False
+
+    def add(self, last_move, modify_skill, last_modify_move, clear_skill):
+        if last_move:
+            self.move = last_move
+        if modify_skill:
+            self.mud_direction = last_modify_move
+        if clear_skill:
+            self.clear_area = True
+
+    def action(self):
+        return self.move, self.mud_direction, self.clear_area
+
+
+class GameLoop:
+    def __init__(self, game, tick_ms=GAME_SPEED, frame_rate=FRAME_RATE):
+        self.game = game
+        self.tick_seconds = tick_ms / 1000
+        self.frame_rate = frame_rate
+        self.display_grid = TerrainGrid(np.asarray(game.grid))
+        self.frame = None
+
+    def snapshot(self):
+        state = self.game.get_state()
+        state["grid"] = np.array(state["grid"])
+        self.frame = state
+
+    def show(self, overlay=None):
+        frame = self.frame
+        changed = self.display_grid != frame["grid"]
+        if changed.any():
+            self.display_grid[changed] = frame["grid"][changed]
+        update_screen(self.display_grid, frame["player_pos"], frame["npc_positions"], frame["npc_clusters"], frame["enemy_delay"],
+                      frame["modify_cooldown"], frame["clear_cooldown"], frame["point"], frame["remaining_turns"], overlay)
+
+    def run(self):
+        game = self.game
+        clock = pygame.time.Clock()
+        tick_input = TickInput()
+        pending = None
+        self.snapshot()
+        next_tick = time.perf_counter() + self.tick_seconds
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="ai") as worker:
+            while True:
+                started = time.perf_counter()
+                running, *events = handle_events()
+                tick_input.add(*events)
+                game.record_phase("input", started)
+                if not running:
+                    break
+
+                if pending is not None and pending.done():
+                    _, _, done = pending.result()
+                    pending = None
+                    self.snapshot()
+                    if done:
+                        if not show_game_over_screen(game.point):
+                            break
+                        game.reset_game()
+                        tick_input.clear()
+                        self.snapshot()
+                        next_tick = time.perf_counter() + self.tick_seconds
+
+                now = time.perf_counter()
+                if pending is None and now >= next_tick:
+                    action = tick_input.action()
+                    tick_input.clear()
+                    begun = game.begin_tick(action)
+                    self.snapshot()
+                    pending = worker.submit(game.finish_tick, action, *begun)
+                    next_tick = max(next_tick + self.tick_seconds, now)
+
+                started = time.perf_counter()
+                self.show(game.profiler.overlay_lines() if game.profiler.enabled else None)
+                game.record_phase("render", started)
+                clock.tick(self.frame_rate)
+        quit_game()
@@ -0,0 +1,380 @@
+import copy
+import heapq
+
+import numpy as np
+
+from distance_field import INF, FIELD_INF, STEP_COST, distance_fields
+from terrain import WALL, PASSABLE
+
+SECTOR_SIZE = 32
+LONG_ENTRANCE = 6
+FIELD_BATCH = 1024
+GOAL_WINDOW = 1
+SEARCH_BUDGET = 1024
+
+
+class HierarchicalPlanner:
+    def __init__(self, grid, sector_size=SECTOR_SIZE):
+        self.grid = grid
+        self.width, self.height = grid.shape
+        self.sector_size = sector_size
+        self.sectors_x = -(-self.width // sector_size)
+        self.sectors_y = -(-self.height // sector_size)
+        self.terrain = np.full((self.sectors_x * sector_size, self.sectors_y * sector_size), WALL, dtype=np.uint8)
+        self.terrain[:self.width, :self.height] = grid
+        self.borders = {}
+        self.sector_nodes = {}
+        self.sector_fields = {}
+        self.inter_out = {}
+        self.inter_in = {}
+        self.intra_in = {}
+        self.changed_cells = []
+        self.owned_out = set()
+        self.owned_in = set()
+        self.version = 0
+        self.rebuild(self.all_borders(), {(sx, sy) for sx in range(self.sectors_x) for sy in range(self.sectors_y)})
+        if hasattr(grid, "add_listener"):
+            grid.add_listener(self.notify)
+
+    def copy(self, grid):
+        clone = copy.copy(self)
+        clone.grid = grid
+        clone.terrain = self.terrain.copy()
+        clone.borders = dict(self.borders)
+        clone.sector_nodes = dict(self.sector_nodes)
+        clone.sector_fields = dict(self.sector_fields)
+        clone.inter_out = dict(self.inter_out)
+        clone.inter_in = dict(self.inter_in)
+        self.owned_out, self.owned_in = set(), set()
+        clone.owned_out, clone.owned_in = set(), set()
+        clone.intra_in = dict(self.intra_in)
+        clone.changed_cells = list(self.changed_cells)
+        if hasattr(grid, "add_listener"):
+            grid.add_listener(clone.notify)
+        return clone
+
+    def detach(self):
+        if hasattr(self.grid, "remove_listener"):
+            self.grid.remove_listener(self.notify)
+
+    def notify(self, cells):
+        self.changed_cells.extend(cells)
+
+    def index(self, pos):
+        return pos[0] * self.height + pos[1]
+
+    def position(self, index):
+        return divmod(index, self.height)
+
+    def sector(self, pos):
+        return pos[0] // self.sector_size, pos[1] // self.sector_size
+
+    def all_borders(self):
+        borders = {("x", sx, sy) for sx in range(self.sectors_x - 1) for sy in range(self.sectors_y)}
+        return borders | {("y", sx, sy) for sx in range(self.sectors_x) for sy in range(self.sectors_y - 1)}
+
+    def refresh(self):
+        if not self.changed_cells:
+            return
+        size = self.sector_size
+        cells = np.asarray(self.grid)
+        borders, sectors = set(), set()
+        for x, y in set(self.changed_cells):
+            if self.terrain[x, y] == cells[x, y]:
+                continue
+            self.terrain[x, y] = cells[x, y]
+            sx, sy = x // size, y // size
+            sectors.add((sx, sy))
+            if x % size == 0 and sx > 0:
+                borders.add(("x", sx - 1, sy))
+                sectors.add((sx - 1, sy))
+            if x % size == size - 1 and x + 1 < self.width:
+                borders.add(("x", sx, sy))
+                sectors.add((sx + 1, sy))
+            if y % size == 0 and sy > 0:
+                borders.add(("y", sx, sy - 1))
+                sectors.add((sx, sy - 1))
+            if y % size == size - 1 and y + 1 < self.height:
+                borders.add(("y", sx, sy))
+                sectors.add((sx, sy + 1))
+        self.changed_cells = []
+        if sectors:
+            self.rebuild(borders, sectors)
+
+    def border_cells(self, border):
+        axis, sx, sy = border
+        size = self.sector_size
+        if axis == "x":
+            x = (sx + 1) * size - 1
+            ys = np.arange(sy * size, min((sy + 1) * size, self.height))
+            return np.stack([np.full_like(ys, x), ys], axis=1), np.stack([np.full_like(ys, x + 1), ys], axis=1)
+        y = (sy + 1) * size - 1
+        xs = np.arange(sx * size, min((sx + 1) * size, self.width))
+        return np.stack([xs, np.full_like(xs, y)], axis=1), np.stack([xs, np.full_like(xs, y + 1)], axis=1)
+
+    def entrances(self, border):
+        near, far = self.border_cells(border)
+        open_cells = PASSABLE[self.terrain[near[:, 0], near[:, 1]]] & PASSABLE[self.terrain[far[:, 0], far[:, 1]]]
+        edges = np.flatnonzero(np.diff(np.concatenate([[0], open_cells.astype(np.int8), [0]])))
+        transitions = []
+        for start, end in zip(edges[::2], edges[1::2]):
+            picks = (start, end - 1) if end - start >= LONG_ENTRANCE else ((start + end - 1) // 2,)
+            transitions.extend((self.index(near[i]), self.index(far[i])) for i in picks)
+        return transitions
+
+    def link(self, a, b):
+        cost = int(STEP_COST[self.terrain[self.position(b)]])
+        self.writable(self.inter_out, self.owned_out, a)[b] = cost
+        self.writable(self.inter_in, self.owned_in, b)[a] = cost
+
+    def unlink(self, a, b):
+        self.writable(self.inter_out, self.owned_out, a).pop(b, None)
+        self.writable(self.inter_in, self.owned_in, b).pop(a, None)
+
+    def writable(self, links, owned, node):
+        if node not in owned:
+            links[node] = dict(links.get(node, ()))
+            owned.add(node)
+        return links[node]
+
+    def rebuild(self, borders, sectors):
+        for border in borders:
+            for a, b in self.borders.get(border, ()):
+                self.unlink(a, b)
+                self.unlink(b, a)
+            self.borders[border] = self.entrances(border)
+            for a, b in self.borders[border]:
+                self.link(a, b)
+                self.link(b, a)
+
+        size = self.sector_size
+        jobs = []
+        for sector in sectors:
+            for node in self.sector_nodes.get(sector, ()):
+                self.intra_in.pop(node, None)
+            sx, sy = sector
+            nodes = set()
+            for border in (("x", sx - 1, sy), ("x", sx, sy), ("y", sx, sy - 1), ("y", sx, sy)):
+                for pair in self.borders.get(border, ()):
+                    nodes.update(node for node in pair if self.sector(self.position(node)) == sector)
+            nodes = sorted(nodes)
+            self.sector_nodes[sector] = nodes
+            self.sector_fields[sector] = []
+            jobs.extend((sector, node) for node in nodes)
+
+        for start in range(0, len(jobs), FIELD_BATCH):
+            batch = jobs[start:start + FIELD_BATCH]
+            blocks = np.stack([self.block(sector) for sector, _ in batch])
+            goals = np.array([self.local(self.position(node)) for _, node in batch])
+            fields = distance_fields(blocks, goals)
+            for (sector, node), field in zip(batch, fields):
+                self.sector_fields[sector].append(field)
+
+        for sector in sectors:
+            nodes = self.sector_nodes[sector]
+            if not nodes:
+                self.sector_fields[sector] = np.zeros((0, size, size), dtype=np.int32)
+                continue
+            fields = np.array(self.sector_fields[sector])
+            self.sector_fields[sector] = fields
+            local = np.array([self.local(self.position(node)) for node in nodes])
+            costs = fields[:, local[:, 0], local[:, 1]].tolist()
+            for node, row in zip(nodes, costs):
+                self.intra_in[node] = [(other, cost) for other, cost in zip(nodes, row)
+                                       if other != node and cost < FIELD_INF]
+        self.version += 1
+
+    def block(self, sector):
+        size = self.sector_size
+        sx, sy = sector
+        return self.terrain[sx * size:(sx + 1) * size, sy * size:(sy + 1) * size]
+
+    def local(self, pos):
+        return pos[0] % self.sector_size, pos[1] % self.sector_size
+
+    def field(self, goal=None, budget=None):
+        return HierarchicalField(self, goal, budget)
+
+
+class AbstractSearch:
+    def __init__(self, planner, key, seeds):
+        self.planner = planner
+        self.key = key
+        self.dist = {}
+        self.open_set = list(seeds)
+        heapq.heapify(self.open_set)
+
+    def copy(self, planner):
+        clone = copy.copy(self)
+        clone.planner = planner
+        clone.dist = dict(self.dist)
+        clone.open_set = list(self.open_set)
+        return clone
+
+    def settle(self, pending=None, limit=None):
+        dist, open_set, planner = self.dist, self.open_set, self.planner
+        if pending is not None:
+            pending = {node for node in pending if node not in dist}
+            if not pending:
+                return
+        popped = 0
+        while open_set and (pending is None or pending):
+            if limit is not None and popped >= limit:
+                return
+            popped += 1
+            cost, node = heapq.heappop(open_set)
+            if node in dist:
+                continue
+            dist[node] = cost
+            if pending is not None:
+                pending.discard(node)
+            for previous, step in planner.intra_in.get(node, ()):
+                if previous not in dist:
+                    heapq.heappush(open_set, (cost + step, previous))
+            for previous, step in planner.inter_in.get(node, {}).items():
+                if previous not in dist:
+                    heapq.heappush(open_set, (cost + step, previous))
+
+    def complete(self):
+        return not self.open_set
+
+
+class HierarchicalField:
+    def __init__(self, planner, goal=None, budget=None):
+        self.planner = planner
+        self.goal = goal
+        self.budget = budget
+        self.search = self.routing = None
+        self.aim()
+
+    def copy(self, planner):
+        clone = copy.copy(self)
+        clone.planner = planner
+        clone.routing = self.routing.copy(planner)
+        clone.search = clone.routing if self.search is self.routing else self.search.copy(planner)
+        return clone
+
+    def aim(self):
+        planner = self.planner
+        planner.refresh()
+        self.version = planner.version
+        self.goal_field = None
+        self.seeds = []
+        goal = self.goal
+        if goal is not None and 0 <= goal[0] < planner.width and 0 <= goal[1] < planner.height:
+            size = planner.sector_size
+            gsx, gsy = planner.sector(goal)
+            sectors_x = range(max(0, gsx - GOAL_WINDOW), min(planner.sectors_x, gsx + GOAL_WINDOW + 1))
+            sectors_y = range(max(0, gsy - GOAL_WINDOW), min(planner.sectors_y, gsy + GOAL_WINDOW + 1))
+            self.goal_origin = (sectors_x[0] * size, sectors_y[0] * size)
+            window = planner.terrain[self.goal_origin[0]:(sectors_x[-1] + 1) * size, self.goal_origin[1]:(sectors_y[-1] + 1) * size]
+            self.goal_field = distance_fields(window[None], np.array([self.window_local(goal)]))[0]
+            for sector in ((sx, sy) for sx in sectors_x for sy in sectors_y):
+                for node in planner.sector_nodes[sector]:
+                    cost = self.goal_field[self.window_local(planner.position(node))]
+                    if cost < FIELD_INF:
+                        self.seeds.append((int(cost), node))
+
+        if self.budget is None:
+            self.search = self.routing = AbstractSearch(planner, (goal, self.version), self.seeds)
+        elif self.routing is None or not self.routing.dist:
+            self.search = AbstractSearch(planner, (goal, self.version), self.seeds)
+            self.search.settle()
+            self.routing = self.search
+
+    def window_local(self, pos):
+        return pos[0] - self.goal_origin[0], pos[1] - self.goal_origin[1]
+
+    def in_window(self, pos):
+        wx, wy = self.window_local(pos)
+        return 0 <= wx < self.goal_field.shape[0] and 0 <= wy < self.goal_field.shape[1]
+
+    def update(self, goal, targets=()):
+        self.planner.refresh()
+        if goal != self.goal or self.version != self.planner.version:
+            self.goal = goal
+            self.aim()
+        if self.budget is not None:
+            if self.search is self.routing and self.search.key != (self.goal, self.version):
+                self.search = AbstractSearch(self.planner, (self.goal, self.version), self.seeds)
+            if self.search is not self.routing:
+                self.search.settle(limit=self.budget)
+                if self.search.complete():
+                    self.routing = self.search
+        for pos in targets:
+            self.settle_sector(pos)
+        return self
+
+    def settle_sector(self, pos):
+        planner = self.planner
+        if self.routing.complete() or not (0 <= pos[0] < planner.width and 0 <= pos[1] < planner.height):
+            return
+        index = planner.index(pos)
+        self.routing.settle(planner.sector_nodes[planner.sector(pos)] + list(planner.inter_out.get(index, ())))
+
+    def route(self, pos):
+        planner = self.planner
+        if self.budget is None and self.version != planner.version:
+            self.aim()
+        if self.goal_field is None or not (0 <= pos[0] < planner.width and 0 <= pos[1] < planner.height):
+            return INF, None, None
+        if self.in_window(pos):
+            cost = self.goal_field[self.window_local(pos)]
+            if cost < FIELD_INF:
+                return int(cost), self.goal_field, self.goal_origin
+
+        self.settle_sector(pos)
+        dist = self.routing.dist
+        best, field, origin = INF, None, None
+        sector = planner.sector(pos)
+        x, y = planner.local(pos)
+        index = planner.index(pos)
+        sector_origin = (sector[0] * planner.sector_size, sector[1] * planner.sector_size)
+        fields = planner.sector_fields[sector]
+        for node, node_field, cost in zip(planner.sector_nodes[sector], fields, fields[:, x, y].tolist()):
+            if node != index and cost < FIELD_INF and cost + dist.get(node, INF) < best:
+                best, field, origin = cost + dist[node], node_field, sector_origin
+        for neighbor, cost in planner.inter_out.get(index, {}).items():
+            if cost + dist.get(neighbor, INF) < best:
+                best, field, origin = cost + dist[neighbor], None, planner.position(neighbor)
+        return best, field, origin
+
+    def distance(self, pos):
+        return self.route(pos)[0]
+
+    def next_step(self, pos):
+        if pos == self.goal:
+            return None
+        best, field, origin = self.route(pos)
+        if best == INF:
+            return None
+        return origin if field is None else self.descend(pos, field, origin)
+
+    def descend(self, pos, field, origin):
+        x, y = pos[0] - origin[0], pos[1] - origin[1]
+        width, height = field.shape
+        for dx, dy in ((-1, 0), (1, 0), (0, -1), (0, 1)):
+            nx, ny = x + dx, y + dy
+            if 0 <= nx < width and 0 <= ny < height and field[nx, ny] < FIELD_INF:
+                neighbor = (pos[0] + dx, pos[1] + dy)
+                if field[nx, ny] + STEP_COST[self.planner.terrain[neighbor]] == field[x, y]:
+                    return neighbor
+        return None
+
+    def path(self, pos, max_steps=None):
+        path = []
+        current, field = pos, None
+        while current != self.goal and (max_steps is None or len(path) < max_steps):
+            if field is None or field[current[0] - origin[0], current[1] - origin[1]] == 0:
+                best, field, origin = self.route(current)
+                if best == INF:
+                    break
+                if field is None:
+                    current = origin
+                    path.append(current)
+                    continue
+            current = self.descend(current, field, origin)
+            if current is None:
+                break
+            path.append(current)
+        return path
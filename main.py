@@ -1,82 +1,227 @@
-import numpy as np
+import copy
 import random
+import time
 from collections import deque
 
-from npc_clustering import cluster_npc_groups
-from pygame_running_and_display import GRID_SIZE, MOVES, MODIFY_KEYS, handle_events, update_screen, show_game_over_screen, quit_game
-from cooperative_astar import cooperative_astar
+import numpy as np
+
+from agents import AgentTable, HELPER, BLOCKER, NO_AGENT
+from ai_scheduler import AIScheduler, AI_BUDGET
+from npc_clustering import RoleManager
+from settings import GRID_SIZE, MOVES, MODIFY_KEYS
+from cooperative_astar import cooperative_astar, copy_path_fields, create_path_fields, detach_path_fields
+from reservation_table import ReservationTable
+from connectivity import ConnectivityIndex
+from map_generator import MapPool, generate_terrain
+from profiler import PhaseProfiler
+from replay import ReplayRecorder, ReplayBuffer
+from search_stats import SearchStats
+from snapshot import GameSnapshot, SharedLevel, TerrainOverlay
+from skill_targets import SkillPlanner, SET_MUD, CLEAR_TERRAIN, PLACE_WALL
+from terrain import EMPTY, MUD, WATER, WALL, TERRAIN_DELAY_LIST, TerrainGrid
 
 MAXIUM_TURNS = 150
 MAX_REGROUP_TURN = 10
 ENEMY_NUMBER = 20
+RESERVATION_WINDOW = 8
+RESPAWN_DISTANCE = 5
+RESPAWN_ATTEMPTS = 100
+LEVEL_STATE = ("grid", "terrain", "connectivity", "path_fields", "reservations")
+PHASES = ("input", "move_player", "mud_field", "clear_area", "enemy_move", "enemy_skill", "regroup", "step", "record", "render")
+
+def check_config(grid_size, enemy_number):
+    if grid_size < 1:
+        raise ValueError(f"grid_size must be positive, got {grid_size}")
+    if enemy_number < 0:
+        raise ValueError(f"enemy_number must not be negative, got {enemy_number}")
+    if enemy_number >= grid_size * grid_size:
+        raise ValueError(f"a {grid_size}x{grid_size} grid fits at most {grid_size * grid_size - 1} enemies, got {enemy_number}")
 
 class GameEnvironment:
-    def __init__(self):
-        self.player_pos, self.npc_positions = self.generate_positions()
-        self.npc_clusters = cluster_npc_groups(self.player_pos, self.npc_positions)
-        self.grid = self.generate_map()
+    def __init__(self, grid_size=GRID_SIZE, enemy_number=ENEMY_NUMBER, max_turns=MAXIUM_TURNS, regroup_turns=MAX_REGROUP_TURN, profile=False, recorder=None, ai_budget=AI_BUDGET, map_pool=None):
+        self.map_pool = map_pool
+        self.source = None
+        self.shared = None
+        self.profiler = PhaseProfiler(enabled=profile)
+        self.recorder = recorder
+        self.scheduler = AIScheduler(ai_budget)
+        self.search_stats = None
+        self.total_search_stats = SearchStats()
+        check_config(grid_size, enemy_number)
+        self.grid_size = grid_size
+        self.enemy_number = enemy_number
+        self.max_turns = max_turns
+        self.regroup_turns = regroup_turns
+
+        self.new_level()
+        self.connectivity = ConnectivityIndex(self.grid)
+        self.path_fields = create_path_fields(self.grid)
+        self.reservations = ReservationTable(self.grid, RESERVATION_WINDOW)
 
         self.player_history = deque(maxlen=10)
         self.player_tendency = self.update_player_tendency()
         
         self.player_delay = 0 
-        self.enemy_delay = [0] * ENEMY_NUMBER
 
         self.point = 0
-        self.RemainingTurn = MAXIUM_TURNS
+        self.captures = 0
+        self.kills = 0
+        self.phase_times = dict.fromkeys(PHASES, 0.0)
+        self.RemainingTurn = self.max_turns
         self.modify_cooldown = 0
         self.clear_cooldown = 0
+        self.turn_count = 0
 
     def reset_game(self):
-        self.player_pos, self.npc_positions = self.generate_positions()
-        self.npc_clusters = cluster_npc_groups(self.player_pos, self.npc_positions)
-        self.grid = self.generate_map()
+        self.own_level()
+        self.new_level()
+        self.connectivity = ConnectivityIndex(self.grid)
+        self.path_fields = create_path_fields(self.grid)
+        self.reservations.watch(self.grid)
         
         self.player_history.clear()
         self.player_tendency = self.update_player_tendency()
 
         self.player_delay = 0
-        self.enemy_delay = [0] * ENEMY_NUMBER
         
         self.point = 0
-        self.RemainingTurn = MAXIUM_TURNS
+        self.captures = 0
+        self.kills = 0
+        self.phase_times = dict.fromkeys(PHASES, 0.0)
+        self.RemainingTurn = self.max_turns
         self.modify_cooldown = 0
         self.clear_cooldown = 0
+        self.turn_count = 0
         
+    def new_level(self):
+        if self.map_pool is None:
+            self.player_pos, npc_positions = self.generate_positions()
+        else:
+            grid, self.player_pos, npc_positions = self.map_pool.take()
+        self.agents = AgentTable((self.grid_size, self.grid_size), npc_positions)
+        self.role_manager = RoleManager()
+        self.respawned = []
+        self.regroup()
+        self.grid = self.generate_map() if self.map_pool is None else TerrainGrid(grid)
+        self.terrain = TerrainOverlay(self.grid)
+
+    def snapshot(self):
+        return GameSnapshot(self)
+
+    def restore(self, snapshot):
+        self.own_level()
+        detach_path_fields(self.path_fields)
+        if snapshot.terrain_base is not self.terrain.base:
+            self.grid = TerrainGrid(snapshot.terrain_base)
+            self.terrain = TerrainOverlay(self.grid, snapshot.terrain_base)
+            self.terrain.apply(snapshot.edit_cells, snapshot.edit_values)
+            self.connectivity = ConnectivityIndex(self.grid)
+        else:
+            self.terrain.apply(snapshot.edit_cells, snapshot.edit_values)
+        self.path_fields = copy_path_fields(snapshot.path_fields, self.grid)
+        self.reservations.watch(self.grid)
+        self.agents.restore(snapshot.positions, snapshot.roles, snapshot.delays)
+        self.reservations.restore(snapshot.reservations)
+        self.role_manager.restore(snapshot.role_manager)
+        self.respawned = list(snapshot.respawned)
+        self.player_pos = snapshot.player_pos
+        self.player_history.clear()
+        self.player_history.extend(snapshot.player_history)
+        self.player_tendency = snapshot.player_tendency
+        self.player_delay = snapshot.player_delay
+        self.point = snapshot.point
+        self.captures = snapshot.captures
+        self.kills = snapshot.kills
+        self.RemainingTurn = snapshot.remaining_turns
+        self.modify_cooldown = snapshot.modify_cooldown
+        self.clear_cooldown = snapshot.clear_cooldown
+        self.turn_count = snapshot.turn_count
+
+    def fork(self):
+        if self.source is None and (self.shared is None or self.shared.grid is None):
+            self.shared = SharedLevel(self)
+        child = copy.copy(self)
+        for name in LEVEL_STATE:
+            child.__dict__.pop(name, None)
+        child.source = self.source or self.shared
+        child.source.forks.add(child)
+        child.shared = None
+        child.agents = self.agents.copy(occupancy=False)
+        child.role_manager = self.role_manager.copy()
+        child.respawned = list(self.respawned)
+        child.map_pool = None
+        child.recorder = None
+        child.profiler = PhaseProfiler(enabled=False)
+        child.scheduler = AIScheduler(self.scheduler.budget, self.scheduler.near_distance)
+        child.search_stats = None
+        child.total_search_stats = SearchStats()
+        child.phase_times = dict.fromkeys(PHASES, 0.0)
+        child.player_history = deque(self.player_history, maxlen=self.player_history.maxlen)
+        return child
+
+    def own_level(self):
+        if self.source is not None:
+            source, self.source = self.source, None
+            source.forks.discard(self)
+            self.grid = TerrainGrid(source.base)
+            self.terrain = TerrainOverlay(self.grid, source.base)
+            self.terrain.apply(source.edit_cells, source.edit_values)
+            self.connectivity = source.connectivity.copy(self.grid)
+            self.path_fields = copy_path_fields(source.path_fields, self.grid)
+            self.reservations = source.reservations.copy(self.grid)
+            self.agents.reindex(self.grid.shape)
+        if self.shared is not None:
+            self.shared.freeze()
+            self.shared = None
+
+    def __getattr__(self, name):
+        if name in LEVEL_STATE and self.__dict__.get("source") is not None:
+            self.own_level()
+            return getattr(self, name)
+        raise AttributeError(f"{type(self).__name__!r} object has no attribute {name!r}")
+
+    @property
+    def npc_positions(self):
+        return self.agents.position_list()
+
+    @property
+    def npc_clusters(self):
+        return self.agents.clusters()
+
+    @property
+    def enemy_delay(self):
+        return self.agents.delays
+
+    def regroup(self):
+        self.agents.set_roles(self.role_manager.regroup(self.player_pos, self.agents.positions))
+        self.respawned = []
+
+    def assign_respawned_roles(self):
+        if not self.respawned:
+            return
+        agents = sorted(set(self.respawned))
+        self.agents.roles[agents] = self.role_manager.assign(self.agents.positions, agents)
+        self.respawned = []
+
     def generate_positions(self):
         while True:
-            player_pos = (random.randint(0, GRID_SIZE - 1), random.randint(0, GRID_SIZE - 1))
+            player_pos = (random.randint(0, self.grid_size - 1), random.randint(0, self.grid_size - 1))
             npc_positions = set()
-            while len(npc_positions) < ENEMY_NUMBER:
-                npc_pos = (random.randint(0, GRID_SIZE - 1), random.randint(0, GRID_SIZE - 1))
+            while len(npc_positions) < self.enemy_number:
+                npc_pos = (random.randint(0, self.grid_size - 1), random.randint(0, self.grid_size - 1))
                 if npc_pos != player_pos :
                     npc_positions.add(npc_pos)
             return player_pos, list(npc_positions)
             
     def generate_map(self):
-        while True:
-            grid = np.random.choice(
-                ["empty", "mud", "water", "wall"],
-                size=(GRID_SIZE, GRID_SIZE),
-                p=[0.7, 0.15, 0.1, 0.05]
-            )
-            grid[self.player_pos] = "empty"
-            for npc_pos in self.npc_positions:
-                grid[npc_pos] = "empty"
-            if self.is_map_valid(grid, self.player_pos, self.npc_positions):
-                return grid
-                
+        grid = generate_terrain(self.grid_size, seed=random.getrandbits(32), keep=[self.player_pos] + self.npc_positions)
+        return TerrainGrid(grid)
+
     def is_map_valid(self,grid, starting_pos, npc_positions):
-        queue = deque([starting_pos])
-        visited = set([starting_pos])
-        while queue:
-            x, y = queue.popleft()
-            for dx, dy in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
-                nx, ny = x + dx, y + dy
-                if 0 <= nx < GRID_SIZE and 0 <= ny < GRID_SIZE and grid[nx, ny] != "wall" and (nx, ny) not in visited:
-                    queue.append((nx, ny))
-                    visited.add((nx, ny))
-        return all(npc in visited for npc in npc_positions) 
+        connectivity = getattr(self, "connectivity", None)
+        if connectivity is None or connectivity.grid is not grid:
+            connectivity = ConnectivityIndex(grid, watch=False)
+        return connectivity.all_reachable(starting_pos, npc_positions)
 
     def record_player_position(self):
         self.player_history.append(self.player_pos)
@@ -93,63 +238,73 @@ class GameEnvironment:
     def update_enemy_position(self):
         self.player_tendency = self.update_player_tendency()
         blocker_target = self.get_blocker_target()
-        planned_paths = cooperative_astar(self.grid, self.npc_positions, self.npc_clusters, self.player_pos, blocker_target)
-        for npc, new_position in planned_paths.items():
-            if npc not in self.npc_positions:
+        agents = self.agents
+        planned_paths = cooperative_astar(self.grid, self.npc_positions, self.npc_clusters, self.player_pos, blocker_target, fields=self.path_fields, reservations=self.reservations, delays=agents.delays.tolist(), stats=self.search_stats, scheduler=self.scheduler)
+        moves = [(agents.agent_at(npc), new_position) for npc, new_position in planned_paths.items()]
+        for i, new_position in moves:
+            if agents.delays[i] > 0:
+                agents.delays[i] -= 1
                 continue
-                
-            i = self.npc_positions.index(npc)
-            if self.enemy_delay[i] > 0:
-                self.enemy_delay[i] -= 1
+            npc = agents.position(i)
+            if new_position != npc and agents.is_occupied(new_position):
                 continue
             
-            for group_name in self.npc_clusters:
-                if npc in self.npc_clusters[group_name]:
-                    self.npc_clusters[group_name].remove(npc)
-                    self.npc_clusters[group_name].append(new_position)
-            self.npc_positions[i] = new_position
+            agents.move(i, new_position)
             
             if abs(new_position[0] - self.player_pos[0]) + abs(new_position[1] - self.player_pos[1]) <= 1:
-                self.respawn_enemy(npc)
+                self.respawn_enemy(i)
                 self.point -= 100
+                self.captures += 1
+                continue
                 
             current_tile = self.grid[new_position[0], new_position[1]]
-            if current_tile == "mud":
-                self.enemy_delay[i] = 1
-            elif current_tile == "water":
-                self.enemy_delay[i] = 2
+            if TERRAIN_DELAY_LIST[current_tile]:
+                agents.delays[i] = TERRAIN_DELAY_LIST[current_tile]
         
     def get_blocker_target(self):
         tendency = self.update_player_tendency()
         predicted_x = round(self.player_pos[0] + 7 * tendency[0])
         predicted_y = round(self.player_pos[1] + 7 * tendency[1])
-        return (max(0, min(GRID_SIZE - 1, predicted_x)), max(0, min(GRID_SIZE - 1, predicted_y)))
+        return (max(0, min(self.grid_size - 1, predicted_x)), max(0, min(self.grid_size - 1, predicted_y)))
 
-    def respawn_enemy(self, npc):
-        if npc not in self.npc_positions:
-            return
-        npc_index = self.npc_positions.index(npc)
+    def respawn_enemy(self, agent):
+        agents = self.agents
+        npc = agents.position(agent)
         
-        while True:
-            new_x, new_y = random.randint(0, GRID_SIZE - 1), random.randint(0, GRID_SIZE - 1)
+        for _ in range(RESPAWN_ATTEMPTS):
+            new_x, new_y = random.randint(0, self.grid_size - 1), random.randint(0, self.grid_size - 1)
             new_position = (new_x, new_y)
 
-            if (self.grid[new_x, new_y] != "wall" and new_position not in self.npc_positions and
-                abs(new_x - self.player_pos[0]) + abs(new_y - self.player_pos[1]) > 5): 
-                self.npc_positions[npc_index] = new_position
+            if (self.grid[new_x, new_y] != WALL and not agents.is_occupied(new_position) and
+                abs(new_x - self.player_pos[0]) + abs(new_y - self.player_pos[1]) > RESPAWN_DISTANCE): 
+                agents.move(agent, new_position)
 
                 if self.is_map_valid(self.grid, self.player_pos, self.npc_positions):
-                    if self.grid[new_x, new_y] == "mud":
-                        self.enemy_delay[npc_index] = 1
-                    elif self.grid[new_x, new_y] == "water":
-                        self.enemy_delay[npc_index] = 2
-                    else:
-                        self.enemy_delay[npc_index] = 0
-                    self.npc_clusters = cluster_npc_groups(self.player_pos, self.npc_positions)
-                    break
+                    agents.delays[agent] = TERRAIN_DELAY_LIST[self.grid[new_x, new_y]]
+                    self.respawned.append(agent)
+                    return
                 else:
-                    self.npc_positions[npc_index] = npc
-                    
+                    agents.move(agent, npc)
+
+        new_position = self.farthest_free_cell()
+        if new_position is not None:
+            agents.move(agent, new_position)
+            agents.delays[agent] = TERRAIN_DELAY_LIST[self.grid[new_position]]
+            self.respawned.append(agent)
+
+    def farthest_free_cell(self):
+        label = self.connectivity.label(self.player_pos)
+        if label < 0:
+            return None
+        free = np.array(self.connectivity.labels).reshape(self.grid.shape) == label
+        free &= self.agents.occupancy == NO_AGENT
+        free[self.player_pos] = False
+        cells = np.argwhere(free)
+        if not len(cells):
+            return None
+        x, y = cells[np.argmax(np.abs(cells - self.player_pos).sum(axis=1))]
+        return int(x), int(y)
+
     def move_player(self, direction):
         self.record_player_position()
         self.player_tendency = self.update_player_tendency()
@@ -158,108 +313,62 @@ class GameEnvironment:
             return
         dx, dy = MOVES[direction]
         new_x, new_y = self.player_pos[0] + dx, self.player_pos[1] + dy
-        if 0 <= new_x < GRID_SIZE and 0 <= new_y < GRID_SIZE and self.grid[new_x, new_y] != "wall":
+        if not (0 <= new_x < self.grid_size and 0 <= new_y < self.grid_size):
+            return
+        if self.grid[new_x, new_y] != WALL:
             self.player_pos = (new_x, new_y)
         current_tile = self.grid[new_x][new_y]
-        if current_tile == "mud":
-            self.player_delay = 1
-        elif current_tile == "water":
-            self.player_delay = 2     
+        if TERRAIN_DELAY_LIST[current_tile]:
+            self.player_delay = TERRAIN_DELAY_LIST[current_tile]
     
     def enemy_skill(self):
         blocker_target = self.get_blocker_target()
-        
-        for npc in self.npc_positions:
-            if npc in self.npc_clusters["helper"]:
-                self.helper_skill(npc, self.player_tendency)
-            elif npc in self.npc_clusters["blocker"]:
-                self.blocker_skill(npc, blocker_target, self.player_tendency)
-    
-    def helper_skill(self, npc, player_tendency):
-        x, y = npc
-        best_target = None
-        best_distance = float("inf")
-        casted_mud = False
-        for dx in range(-5, 6):
-            for dy in range(-5, 6):
-                if abs(dx) + abs(dy) > 5 or abs(dx) + abs(dy) < 4:
-                  continue
-                target_x, target_y = self.player_pos[0] + dx, self.player_pos[1] + dy
-                if 0 <= target_x < GRID_SIZE and 0 <= target_y < GRID_SIZE:
-                    
-                    helper_dist = abs(target_x-x) + abs(target_y-y)
-                    dot_product = dx * player_tendency[0] + dy * player_tendency[1]
-                    
-                    if (dot_product >= 0 and helper_dist <= 5 and
-                        self.grid[target_x, target_y] == "empty" and
-                        (target_x, target_y) not in self.npc_positions and
-                        abs(dx) + abs(dy) < best_distance):
-                        best_target = (target_x, target_y)
-                        best_distance = abs(dx) + abs(dy)
-        
-        if best_target:
-            self.helper_set_mud(best_target)
-            self.enemy_delay[self.npc_positions.index(npc)] = 1
-            casted_mud = True
-
-        if casted_mud == False:
-          best_target = None
-          best_distance = float("inf")
-          for dx in range(-5, 6):
-            for dy in range(-5, 6):
-                if abs(dx) + abs(dy) > 5:
-                  continue
-                target_x, target_y = self.player_pos[0] + dx, self.player_pos[1] + dy
-                if 0 <= target_x < GRID_SIZE and 0 <= target_y < GRID_SIZE:
-                    
-                    helper_dist = abs(target_x-x) + abs(target_y-y)
-                    dot_product =dx * player_tendency[0] + dy * player_tendency[1]
-                    
-                    if (dot_product < 0 and helper_dist <= 5 and
-                        self.grid[target_x, target_y] in ["mud", "water"] and
-                        (target_x, target_y) not in self.npc_positions and
-                        abs(dx) + abs(dy) < best_distance):
-                        best_target = (target_x, target_y)
-                        best_distance = abs(dx) + abs(dy)
-          if best_target:
-            self.helper_clear_terrain(best_target) 
-            
+        planner = self.skill_planner(self.player_tendency, blocker_target, self.agents.with_role(HELPER), self.agents.with_role(BLOCKER))
+        try:
+            for agent in range(len(self.agents)):
+                if self.agents.roles[agent] == HELPER:
+                    self.helper_skill(agent, self.player_tendency, planner)
+                elif self.agents.roles[agent] == BLOCKER:
+                    self.blocker_skill(agent, blocker_target, self.player_tendency, planner)
+        finally:
+            planner.detach()
+
+    def skill_planner(self, player_tendency, blocker_target, helpers=(), blockers=()):
+        positions = self.agents.positions
+        return SkillPlanner(self.grid, self.agents.occupancy, self.player_pos, player_tendency, blocker_target,
+                            helpers, positions[list(helpers)], blockers, positions[list(blockers)])
+
+    def helper_skill(self, agent, player_tendency, planner=None):
+        if planner is None:
+            planner = self.skill_planner(player_tendency, self.player_pos, helpers=[agent])
+            planner.detach()
+        kind, target = planner.helper_target(agent)
+        if kind == SET_MUD:
+            self.helper_set_mud(target)
+            self.agents.delays[agent] = 1
+        elif kind == CLEAR_TERRAIN:
+            self.helper_clear_terrain(target)
+
     def helper_set_mud(self, position):
-        self.grid[position] = "mud"
+        self.grid[position] = MUD
     
     def helper_clear_terrain(self, position):
-        if self.grid[position] == "water":
-            self.grid[position] = "mud"
-        elif self.grid[position] == "mud":
-            self.grid[position] = "empty"
+        if self.grid[position] == WATER:
+            self.grid[position] = MUD
+        elif self.grid[position] == MUD:
+            self.grid[position] = EMPTY
           
-    def blocker_skill(self, npc, blocker_target, player_tendency):
-        x, y = npc
-        best_target = None
-        best_score = -float("inf")
-        
-        for dx in range(-5, 6):
-            for dy in range(-5, 6):
-                if abs(dx) + abs(dy) > 5:
-                  continue
-                target_x, target_y = blocker_target[0] + dx, blocker_target[1] + dy
-                blocker_dist = abs(target_x-x) + abs(target_y-y)
-                if (0 <= target_x < GRID_SIZE and 0 <= target_y < GRID_SIZE and 
-                    self.grid[target_x, target_y] != "wall" and
-                    blocker_dist<=5):
-                    
-                    score = -abs(target_x - blocker_target[0]) - abs(target_y - blocker_target[1])
-                    if self.grid[target_x, target_y] == "empty":
-                        score += 3
-                    if score > best_score:
-                        best_target = (target_x, target_y)
-                        best_score = score
-        
-        if best_target and best_target != self.player_pos:
-            self.grid[best_target] = "wall"
-            if not self.is_map_valid(self.grid, self.player_pos, self.npc_positions):
-                self.grid[best_target] = "empty" 
-            self.enemy_delay[self.npc_positions.index(npc)] = 1
+    def blocker_skill(self, agent, blocker_target, player_tendency, planner=None):
+        if planner is None:
+            planner = self.skill_planner(player_tendency, blocker_target, blockers=[agent])
+            planner.detach()
+        kind, best_target = planner.blocker_target(agent)
+        if kind == PLACE_WALL and best_target != self.player_pos:
+            if self.connectivity.would_disconnect(best_target, self.player_pos, self.npc_positions):
+                self.grid[best_target] = EMPTY
+            else:
+                self.grid[best_target] = WALL
+            self.agents.delays[agent] = 1
 
     def create_mud_field(self, direction):
         if self.modify_cooldown > 0:
@@ -273,12 +382,12 @@ class GameEnvironment:
                 target_x = start_x + width if dx == 0 else start_x + depth * dx
                 target_y = start_y + width if dy == 0 else start_y + depth * dy
                 
-                if 0 <= target_x < GRID_SIZE and 0 <= target_y < GRID_SIZE:
-                    if self.grid[target_x, target_y] == "empty":
-                        self.grid[target_x, target_y] = "mud"
-                        if (target_x, target_y) in self.npc_positions:
-                            npc_index = self.npc_positions.index((target_x, target_y))
-                            self.enemy_delay[npc_index] += 1
+                if 0 <= target_x < self.grid_size and 0 <= target_y < self.grid_size:
+                    if self.grid[target_x, target_y] == EMPTY:
+                        self.grid[target_x, target_y] = MUD
+                        npc_index = self.agents.agent_at((target_x, target_y))
+                        if npc_index >= 0:
+                            self.agents.delays[npc_index] += 1
         self.modify_cooldown = 5
         
     def clear_nearby_area(self):
@@ -289,54 +398,128 @@ class GameEnvironment:
         for dx in range(-3, 4):
             for dy in range(-3, 4):
                 target_x, target_y = self.player_pos[0] + dx, self.player_pos[1] + dy
-                if 0 <= target_x < GRID_SIZE and 0 <= target_y < GRID_SIZE:
+                if 0 <= target_x < self.grid_size and 0 <= target_y < self.grid_size:
                     affected_positions.append((target_x, target_y))
         
         for pos in affected_positions:
-            if 0 <= pos[0] < GRID_SIZE and 0 <= pos[1] < GRID_SIZE:
-                if pos in self.npc_positions:
+            if 0 <= pos[0] < self.grid_size and 0 <= pos[1] < self.grid_size:
+                npc_index = self.agents.agent_at(pos)
+                if npc_index >= 0:
                     self.point += 50
-                    self.respawn_enemy(pos)
-                self.grid[pos[0], pos[1]] = "empty"
+                    self.kills += 1
+                    self.respawn_enemy(npc_index)
+                self.grid[pos[0], pos[1]] = EMPTY
         
         self.clear_cooldown = 5
     
-    def run(self):
-        running = True
-        turn_count = 0
-        while running:
-            running, last_move, modify_skill, last_modify_move, clear_skill = handle_events()
-            if not running:
-                break
-            if last_move:
-                self.move_player(last_move)
-            if modify_skill:
-                self.create_mud_field(last_modify_move)
-            if clear_skill:
-                self.clear_nearby_area()
-
-            self.update_enemy_position()
-            self.enemy_skill()
-
-            if turn_count >= MAX_REGROUP_TURN:
-                self.npc_clusters = cluster_npc_groups(self.player_pos, self.npc_positions)
-                turn_count = 0
-
-            self.point += 1
-            turn_count += 1
-            self.modify_cooldown = max(0, self.modify_cooldown - 1)
-            self.clear_cooldown = max(0, self.clear_cooldown - 1)
-            self.RemainingTurn = max(0, self.RemainingTurn - 1)
-            
-            if self.RemainingTurn == 0:
-                if show_game_over_screen(self.point):
-                    self.reset_game()
-                    continue
-                else:
-                    break
-            update_screen(self.grid, self.player_pos, self.npc_positions, self.npc_clusters, self.enemy_delay, self.modify_cooldown, self.clear_cooldown, self.point, self.RemainingTurn)
-        quit_game()
+    def get_state(self):
+        return {
+            "grid": self.grid,
+            "player_pos": self.player_pos,
+            "npc_positions": self.npc_positions,
+            "npc_clusters": self.npc_clusters,
+            "enemy_delay": self.agents.delays.tolist(),
+            "player_delay": self.player_delay,
+            "point": self.point,
+            "remaining_turns": self.RemainingTurn,
+            "modify_cooldown": self.modify_cooldown,
+            "clear_cooldown": self.clear_cooldown
+        }
+
+    def step(self, action=(None, None, False)):
+        return self.finish_tick(action, *self.begin_tick(action))
+
+    def begin_tick(self, action):
+        self.own_level()
+        move, mud_direction, clear = action
+        previous_point = self.point
+        self.profiler.tick += 1
+        if self.profiler.enabled:
+            self.search_stats = SearchStats()
+        step_started = started = time.perf_counter()
+        if move:
+            self.move_player(move)
+        started = self.record_phase("move_player", started)
+        if mud_direction:
+            self.create_mud_field(mud_direction)
+        started = self.record_phase("mud_field", started)
+        if clear:
+            self.clear_nearby_area()
+        self.record_phase("clear_area", started)
+        return step_started, previous_point
+
+    def finish_tick(self, action, step_started, previous_point):
+        started = time.perf_counter()
+        self.assign_respawned_roles()
+        self.update_enemy_position()
+        started = self.record_phase("enemy_move", started)
+        self.assign_respawned_roles()
+        self.enemy_skill()
+        started = self.record_phase("enemy_skill", started)
+
+        if self.turn_count >= self.regroup_turns or self.role_manager.drifted(self.agents.positions):
+            self.regroup()
+            self.turn_count = 0
+        self.record_phase("regroup", started)
+
+        self.point += 1
+        self.turn_count += 1
+        self.modify_cooldown = max(0, self.modify_cooldown - 1)
+        self.clear_cooldown = max(0, self.clear_cooldown - 1)
+        self.RemainingTurn = max(0, self.RemainingTurn - 1)
+        started = self.record_phase("step", step_started)
+        if self.recorder is not None:
+            self.recorder.record(self, action)
+            self.record_phase("record", started)
+        if self.search_stats is not None:
+            self.total_search_stats.merge(self.search_stats)
+            for role, counters in self.search_stats.roles.items():
+                self.profiler.record_counters(f"search.{role}", counters.as_dict())
+            self.profiler.record_counters("scheduler", self.scheduler.last)
+        return self.get_state(), self.point - previous_point, self.RemainingTurn == 0
+
+    def record_phase(self, phase, started, now=None):
+        now = time.perf_counter() if now is None else now
+        self.phase_times[phase] += now - started
+        if self.profiler.enabled:
+            self.profiler.record(phase, started, now - started)
+        return now
+
+    def run(self, trace_path=None, dump_path=None):
+        try:
+            self.play(trace_path)
+        except BaseException:
+            if dump_path and isinstance(self.recorder, ReplayBuffer):
+                self.recorder.dump(dump_path)
+            raise
+        finally:
+            if isinstance(self.recorder, ReplayRecorder):
+                self.recorder.close()
+
+    def play(self, trace_path=None):
+        from game_loop import GameLoop
+
+        GameLoop(self).run()
+        if trace_path:
+            self.profiler.export(trace_path)
 
 if __name__ == "__main__":
-    game = GameEnvironment()
-    game.run()
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profile", action="store_true", help="time every phase and show the slowest ones in-game")
+    parser.add_argument("--trace", help="write the phase timings to a Chrome trace (.json) or CSV (.csv) on exit")
+    parser.add_argument("--record", help="record every tick to a replay file")
+    parser.add_argument("--ring", type=int, help="keep the last N ticks in memory and dump them if the game crashes")
+    parser.add_argument("--dump", default="crash.replay", help="where --ring writes its ticks")
+    args = parser.parse_args()
+    shape = (GRID_SIZE, GRID_SIZE)
+    recorder = None
+    if args.record:
+        recorder = ReplayRecorder(args.record, shape, ENEMY_NUMBER)
+    elif args.ring:
+        recorder = ReplayBuffer(args.ring, shape, ENEMY_NUMBER)
+    map_pool = MapPool(GRID_SIZE, ENEMY_NUMBER)
+    game = GameEnvironment(profile=args.profile or bool(args.trace), recorder=recorder, map_pool=map_pool)
+    game.run(args.trace, args.dump)
+    map_pool.close()
@@ -0,0 +1,131 @@
+import queue
+import threading
+
+import numpy as np
+
+from terrain import EMPTY, WALL, PASSABLE, TERRAIN_PROBABILITIES
+
+NO_LABEL = np.iinfo(np.int64).max
+MIN_CARVED_SIZE = 8
+POOL_SIZE = 4
+SEARCH_RADIUS = 16
+
+
+def label_components(passable):
+    flat = passable.ravel()
+    parent = np.arange(flat.size)
+    width = passable.shape[1]
+    right = np.flatnonzero(flat[:-1] & flat[1:])
+    right = right[(right + 1) % width != 0]
+    down = np.flatnonzero(flat[:-width] & flat[width:])
+    first = np.concatenate((right, down))
+    second = np.concatenate((right + 1, down + width))
+    while True:
+        a, b = parent[first], parent[second]
+        linked = a != b
+        if not linked.any():
+            break
+        first, second, a, b = first[linked], second[linked], a[linked], b[linked]
+        np.minimum.at(parent, np.maximum(a, b), np.minimum(a, b))
+        while True:
+            jumped = parent[parent]
+            if np.array_equal(jumped, parent):
+                break
+            parent = jumped
+    return np.where(passable, parent.reshape(passable.shape), NO_LABEL)
+
+
+def nearest_cell(labels, component, start, radius=SEARCH_RADIUS):
+    while True:
+        x0, y0 = max(start[0] - radius, 0), max(start[1] - radius, 0)
+        x1, y1 = start[0] + radius + 1, start[1] + radius + 1
+        cells = np.argwhere(labels[x0:x1, y0:y1] == component) + (x0, y0)
+        whole = x0 == 0 and y0 == 0 and x1 >= labels.shape[0] and y1 >= labels.shape[1]
+        if len(cells):
+            distances = np.abs(cells - start).sum(axis=1)
+            best = np.argmin(distances)
+            if distances[best] <= radius or whole:
+                return tuple(cells[best])
+        radius *= 2
+
+
+def carve(grid, labels, start, end, component):
+    (x0, y0), (x1, y1) = start, end
+    xs = slice(min(x0, x1), max(x0, x1) + 1)
+    ys = slice(min(y0, y1), max(y0, y1) + 1)
+    row = grid[xs, y0]
+    row[row == WALL] = EMPTY
+    column = grid[x1, ys]
+    column[column == WALL] = EMPTY
+    labels[xs, y0] = component
+    labels[x1, ys] = component
+
+
+def connect_terrain(grid, keep=()):
+    passable = PASSABLE[grid]
+    labels = label_components(passable)
+    cells = np.flatnonzero(passable)
+    order = np.argsort(labels.ravel()[cells], kind="stable")
+    components, starts, sizes = np.unique(labels.ravel()[cells[order]], return_index=True, return_counts=True)
+    if len(components) <= 1:
+        return grid
+    main = labels[keep[0]] if keep else components[np.argmax(sizes)]
+    kept = np.isin(components, [labels[pos] for pos in keep])
+    small = (sizes < MIN_CARVED_SIZE) & ~kept
+    grid[np.isin(labels, components[small])] = WALL
+
+    center = np.array(keep[0] if keep else np.unravel_index(main, grid.shape))
+    anchors = np.column_stack(np.unravel_index(components, grid.shape))
+    for i in np.argsort(np.abs(anchors - center).sum(axis=1), kind="stable"):
+        if small[i] or components[i] == main:
+            continue
+        start = tuple(anchors[i])
+        carve(grid, labels, start, nearest_cell(labels, main, start), main)
+        labels.ravel()[cells[order[starts[i]:starts[i] + sizes[i]]]] = main
+    return grid
+
+
+def generate_terrain(size, p=TERRAIN_PROBABILITIES, seed=None, keep=()):
+    rng = np.random.default_rng(seed)
+    grid = rng.choice(len(p), size=(size, size), p=p).astype(np.uint8)
+    keep = [tuple(pos) for pos in keep]
+    for pos in keep:
+        grid[pos] = EMPTY
+    return connect_terrain(grid, keep)
+
+
+def generate_level(size, enemy_number, p=TERRAIN_PROBABILITIES, seed=None):
+    rng = np.random.default_rng(seed)
+    cells = rng.choice(size * size, size=enemy_number + 1, replace=False)
+    positions = [divmod(int(cell), size) for cell in cells]
+    grid = generate_terrain(size, p, rng, positions)
+    return grid, positions[0], positions[1:]
+
+
+class MapPool:
+    def __init__(self, size, enemy_number, capacity=POOL_SIZE, p=TERRAIN_PROBABILITIES, seed=None):
+        self.size = size
+        self.enemy_number = enemy_number
+        self.p = p
+        self.seeds = np.random.SeedSequence(seed)
+        self.levels = queue.Queue(maxsize=capacity)
+        self.stopped = threading.Event()
+        self.worker = threading.Thread(target=self.fill, name="map-pool", daemon=True)
+        self.worker.start()
+
+    def fill(self):
+        while not self.stopped.is_set():
+            level = generate_level(self.size, self.enemy_number, self.p, self.seeds.spawn(1)[0])
+            while not self.stopped.is_set():
+                try:
+                    self.levels.put(level, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+
+    def take(self):
+        return self.levels.get()
+
+    def close(self):
+        self.stopped.set()
+        self.worker.join()
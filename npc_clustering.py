@@ -1,49 +1,159 @@
 import numpy as np
-import random
 
-def kmeans_clustering(npc_positions, k=3, max_iterations=100):
+REGROUP_DRIFT = 0.25
+
+def kmeans_plus_plus(points, k, rng):
+    centroids = [points[rng.integers(len(points))]]
+    for _ in range(1, k):
+        distances = np.min(np.sum((points[:, None, :] - np.array(centroids)[None, :, :]) ** 2, axis=2), axis=1)
+        total = distances.sum()
+        if total == 0:
+            centroids.append(points[rng.integers(len(points))])
+        else:
+            centroids.append(points[rng.choice(len(points), p=distances / total)])
+    return np.array(centroids, dtype=np.int64)
+
+def kmeans_clustering(npc_positions, k=3, max_iterations=100, initial_centroids=None, seed=None):
     if len(npc_positions) < k:
         return list(range(len(npc_positions))), npc_positions
 
-    centroids = random.sample(npc_positions, k)
+    points = np.asarray(npc_positions, dtype=np.int64)
+    if initial_centroids is not None and len(initial_centroids) == k:
+        centroids = np.asarray(initial_centroids, dtype=np.int64)
+    else:
+        rng = np.random.default_rng(seed if seed is not None else np.random.randint(2 ** 31))
+        centroids = kmeans_plus_plus(points, k, rng)
+
     for _ in range(max_iterations):
-        clusters = {i: [] for i in range(k)}
-        labels = []
-
-        for npc in npc_positions:
-            distances = [np.linalg.norm(np.array(npc) - np.array(centroid)) for centroid in centroids]
-            closest_cluster = distances.index(min(distances))
-            clusters[closest_cluster].append(npc)
-            labels.append(closest_cluster)
-
-        new_centroids = []
-        for i in range(k):
-            if clusters[i]: 
-                cluster_points = np.array(clusters[i])
-                new_centroids.append(tuple(np.mean(cluster_points, axis=0).astype(int)))
-            else:
-                new_centroids.append(centroids[i])
-
-        if new_centroids == centroids:
+        distances = np.sum((points[:, None, :] - centroids[None, :, :]) ** 2, axis=2)
+        labels = np.argmin(distances, axis=1)
+
+        counts = np.bincount(labels, minlength=k)
+        sums = np.stack([np.bincount(labels, weights=points[:, axis], minlength=k) for axis in range(2)], axis=1)
+        means = (sums / np.maximum(counts, 1)[:, None]).astype(np.int64)
+        new_centroids = np.where(counts[:, None] > 0, means, centroids)
+
+        if np.array_equal(new_centroids, centroids):
             break
         centroids = new_centroids
 
-    return labels, centroids
-
-def cluster_npc_groups(player_pos, npc_positions):
-    
-    labels, centroids = kmeans_clustering(npc_positions, k=3)
+    return labels.tolist(), [tuple(int(c) for c in centroid) for centroid in centroids]
 
+def rank_roles(player_pos, centroids):
     distances = [np.linalg.norm(np.array(centroid) - np.array(player_pos)) for centroid in centroids]
-    sorted_groups = np.argsort(distances)
+    ranks = np.empty(len(centroids), dtype=np.int8)
+    ranks[np.argsort(distances)] = np.arange(len(centroids))
+    return np.minimum(ranks, 2)
+
+def cluster_npc_roles(player_pos, npc_positions, initial_centroids=None, seed=None):
+
+    labels, centroids = kmeans_clustering(npc_positions, k=3, initial_centroids=initial_centroids, seed=seed)
+    return rank_roles(player_pos, centroids)[labels].tolist(), centroids
+
+class RoleManager:
+    def __init__(self, k=3, drift_threshold=REGROUP_DRIFT):
+        self.k = k
+        self.drift_threshold = drift_threshold
+        self.centroids = None
+        self.labels = np.zeros(0, dtype=np.int64)
+        self.label_roles = np.zeros(0, dtype=np.int8)
+
+    def regroup(self, player_pos, positions, seed=None):
+        labels, centroids = kmeans_clustering(positions, k=self.k, initial_centroids=self.centroids, seed=seed)
+        self.centroids = np.array(centroids, dtype=np.int64).reshape(-1, 2)
+        self.labels = np.array(labels, dtype=np.int64)
+        self.label_roles = rank_roles(player_pos, self.centroids)
+        return self.label_roles[self.labels]
+
+    def assign(self, positions, agents):
+        agents = np.asarray(agents, dtype=np.int64)
+        distances = np.sum((positions[agents, None, :] - self.centroids[None, :, :]) ** 2, axis=2)
+        self.labels[agents] = np.argmin(distances, axis=1)
+        return self.label_roles[self.labels[agents]]
+
+    def drift(self, positions):
+        count = len(self.centroids)
+        members = np.bincount(self.labels, minlength=count)
+        sums = np.stack([np.bincount(self.labels, weights=positions[:, axis], minlength=count) for axis in range(2)], axis=1)
+        means = np.where(members[:, None] > 0, sums / np.maximum(members, 1)[:, None], self.centroids)
+        distances = np.sum((positions[:, None, :] - means[None, :, :]) ** 2, axis=2)
+        own = distances[np.arange(len(positions)), self.labels]
+        return float(np.mean(distances.min(axis=1) < own)) if len(positions) else 0.0
+
+    def drifted(self, positions):
+        return self.drift(positions) > self.drift_threshold
+
+    def copy(self):
+        clone = RoleManager(self.k, self.drift_threshold)
+        clone.restore(self.snapshot())
+        return clone
+
+    def snapshot(self):
+        return self.centroids, self.labels.copy(), self.label_roles
+
+    def restore(self, state):
+        self.centroids, labels, self.label_roles = state
+        self.labels = labels.copy()
+
+def cluster_npc_groups(player_pos, npc_positions, initial_centroids=None, seed=None, return_centroids=False):
+
+    roles, centroids = cluster_npc_roles(player_pos, npc_positions, initial_centroids=initial_centroids, seed=seed)
 
     clustered_npcs = {"chaser": [], "helper": [], "blocker": []}
-    for npc, label in zip(npc_positions, labels):
-        if label == sorted_groups[0]:
-            clustered_npcs["chaser"].append(npc)
-        elif label == sorted_groups[1]:
-            clustered_npcs["helper"].append(npc)
-        else:
-            clustered_npcs["blocker"].append(npc)
+    group_names = list(clustered_npcs)
+    for npc, role in zip(npc_positions, roles):
+        clustered_npcs[group_names[role]].append(npc)
+
+    if return_centroids:
+        return clustered_npcs, centroids
+    return clustered_npcs
+
+def batch_kmeans_clustering(points, k=3, max_iterations=100, initial_centroids=None, rng=None):
+    points = np.asarray(points, dtype=np.int64)
+    batch, count, _ = points.shape
+    rows = np.arange(batch)
+    if initial_centroids is not None:
+        centroids = np.asarray(initial_centroids, dtype=np.int64).copy()
+    else:
+        rng = rng if rng is not None else np.random.default_rng()
+        chosen = [rng.integers(count, size=batch)]
+        for _ in range(1, k):
+            picked = points[rows[:, None], np.stack(chosen, axis=1)]
+            distances = np.min(np.sum((points[:, :, None, :] - picked[:, None, :, :]) ** 2, axis=3), axis=2)
+            cumulative = np.cumsum(distances, axis=1)
+            threshold = rng.random(batch) * cumulative[:, -1]
+            choice = np.argmax(cumulative > threshold[:, None], axis=1)
+            chosen.append(np.where(cumulative[:, -1] > 0, choice, rng.integers(count, size=batch)))
+        centroids = points[rows[:, None], np.stack(chosen, axis=1)]
+
+    for _ in range(max_iterations):
+        distances = np.sum((points[:, :, None, :] - centroids[:, None, :, :]) ** 2, axis=3)
+        labels = np.argmin(distances, axis=2)
+        one_hot = labels[:, :, None] == np.arange(k)
+        counts = one_hot.sum(axis=1)
+        sums = np.einsum("bnk,bnd->bkd", one_hot.astype(np.int64), points)
+        means = sums // np.maximum(counts, 1)[:, :, None]
+        new_centroids = np.where(counts[:, :, None] > 0, means, centroids)
+        if np.array_equal(new_centroids, centroids):
+            break
+        centroids = new_centroids
+    return labels, centroids
+
+def batch_rank_roles(player_positions, centroids):
+    distances = np.linalg.norm(centroids - np.asarray(player_positions)[:, None, :], axis=2)
+    return np.argsort(np.argsort(distances, axis=1, kind="stable"), axis=1)
+
+def batch_assign_roles(player_positions, labels, centroids):
+    return np.take_along_axis(batch_rank_roles(player_positions, centroids), labels, axis=1)
+
+def batch_nearest_clusters(points, centroids):
+    return np.argmin(np.sum((points[:, :, None, :] - centroids[:, None, :, :]) ** 2, axis=3), axis=2)
 
-    return clustered_npcs
\ No newline at end of file
+def batch_drift(points, labels, centroids):
+    one_hot = labels[:, :, None] == np.arange(centroids.shape[1])
+    counts = one_hot.sum(axis=1)
+    sums = np.einsum("bnk,bnd->bkd", one_hot.astype(np.int64), points)
+    means = np.where(counts[:, :, None] > 0, sums / np.maximum(counts, 1)[:, :, None], centroids)
+    distances = np.sum((points[:, :, None, :] - means[:, None, :, :]) ** 2, axis=3)
+    own = np.take_along_axis(distances, labels[:, :, None], axis=2)[..., 0]
+    return (distances.min(axis=2) < own).mean(axis=1)
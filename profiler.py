@@ -0,0 +1,103 @@
+import csv
+import json
+import threading
+import time
+from collections import deque
+
+WINDOW = 300
+MAX_EVENTS = 100000
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class PhaseProfiler:
+    def __init__(self, enabled=False, window=WINDOW, max_events=MAX_EVENTS):
+        self.enabled = enabled
+        self.window = window
+        self.tick = 0
+        self.origin = time.perf_counter()
+        self.durations = {}
+        self.counters = {}
+        self.events = deque(maxlen=max_events)
+        self.counter_events = deque(maxlen=max_events)
+        self.lock = threading.Lock()
+
+    def record(self, phase, started, elapsed):
+        with self.lock:
+            if phase not in self.durations:
+                self.durations[phase] = deque(maxlen=self.window)
+            self.durations[phase].append(elapsed)
+            self.events.append((self.tick, phase, started - self.origin, elapsed))
+
+    def record_counters(self, name, values):
+        with self.lock:
+            for key, value in values.items():
+                series = f"{name}.{key}"
+                if series not in self.counters:
+                    self.counters[series] = deque(maxlen=self.window)
+                self.counters[series].append(value)
+            self.counter_events.append((self.tick, name, time.perf_counter() - self.origin, dict(values)))
+
+    def summary(self):
+        with self.lock:
+            durations = {phase: list(values) for phase, values in self.durations.items()}
+        return {phase: {
+            "p50_ms": 1000 * percentile(values, 0.5),
+            "p95_ms": 1000 * percentile(values, 0.95),
+            "max_ms": 1000 * max(values),
+            "samples": len(values)
+        } for phase, values in durations.items() if values}
+
+    def counter_summary(self):
+        with self.lock:
+            counters = {series: list(values) for series, values in self.counters.items()}
+        return {series: {
+            "p50": percentile(values, 0.5),
+            "p95": percentile(values, 0.95),
+            "max": max(values),
+            "samples": len(values)
+        } for series, values in counters.items() if values}
+
+    def overlay_lines(self, count=4):
+        summary = sorted(self.summary().items(), key=lambda item: -item[1]["p95_ms"])
+        return [f"{phase} p50 {stats['p50_ms']:.1f} p95 {stats['p95_ms']:.1f} max {stats['max_ms']:.1f} ms"
+                for phase, stats in summary[:count]]
+
+    def export_chrome_trace(self, path):
+        events = [{
+            "name": phase,
+            "ph": "X",
+            "ts": 1e6 * started,
+            "dur": 1e6 * elapsed,
+            "pid": 0,
+            "tid": 0,
+            "args": {"tick": tick}
+        } for tick, phase, started, elapsed in self.events]
+        events.extend({
+            "name": name,
+            "ph": "C",
+            "ts": 1e6 * recorded,
+            "pid": 0,
+            "args": values
+        } for tick, name, recorded, values in self.counter_events)
+        with open(path, "w") as trace_file:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, trace_file)
+
+    def export_csv(self, path):
+        with open(path, "w", newline="") as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(["tick", "name", "start_ms", "duration_ms", "value"])
+            for tick, phase, started, elapsed in self.events:
+                writer.writerow([tick, phase, f"{1000 * started:.3f}", f"{1000 * elapsed:.3f}", ""])
+            for tick, name, recorded, values in self.counter_events:
+                for key, value in values.items():
+                    writer.writerow([tick, f"{name}.{key}", f"{1000 * recorded:.3f}", "", value])
+
+    def export(self, path):
+        if path.endswith(".csv"):
+            self.export_csv(path)
+        else:
+            self.export_chrome_trace(path)
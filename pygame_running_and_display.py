@@ -1,16 +1,12 @@
 import pygame
+import numpy as np
 import os
 
-GRID_SIZE = 30
-CELL_SIZE = 20
-UI_HEIGHT = 50
-GAME_SPEED = 500
+from settings import GRID_SIZE, CELL_SIZE, UI_HEIGHT, GAME_SPEED
+from terrain import TERRAIN_NAMES, TERRAIN_COLOR_LIST, TERRAIN_COLORS
 
 COLORS = {
-    "empty": (200, 200, 200),
-    "wall": (0, 0, 0),
-    "mud": (139, 69, 19),
-    "water": (30, 144, 255),
+    **dict(zip(TERRAIN_NAMES, TERRAIN_COLOR_LIST)),
     "player": (0, 255, 0),
     "chaser": (255, 0, 0),
     "helper": (255, 165, 0),
@@ -20,29 +16,171 @@ COLORS = {
     "blocker_delayed": (64, 0, 64)
 }
 MOVES = {
-    pygame.K_UP: (0, -1),
-    pygame.K_DOWN: (0, 1),
-    pygame.K_LEFT: (-1, 0),
-    pygame.K_RIGHT: (1, 0)
+    pygame.K_UP: "up",
+    pygame.K_DOWN: "down",
+    pygame.K_LEFT: "left",
+    pygame.K_RIGHT: "right"
 }
 MODIFY_KEYS = {
-    pygame.K_w: (0, -1),
-    pygame.K_s: (0, 1),
-    pygame.K_a: (-1, 0),
-    pygame.K_d: (1, 0)
+    pygame.K_w: "up",
+    pygame.K_s: "down",
+    pygame.K_a: "left",
+    pygame.K_d: "right"
 }
+MAX_BOARD_PIXELS = 1024
+OVERLAY_LINE_HEIGHT = 14
+LABEL_GAP = 10
+LABEL_PADDING = 10
+LABEL_BOX_WIDTH = 120
+BOXED_LABELS = ("mud", "clear")
+SCREEN = None
+FONT = None
+SMALL_FONT = None
+RENDERER = None
 
-def init_pygame():
+def init_pygame(size=None):
     pygame.font.init()
     font = pygame.font.Font(None, 36)
     os.environ["SDL_AUDIODRIVER"] = "dummy"
     pygame.init()
-    screen = pygame.display.set_mode((GRID_SIZE * CELL_SIZE, GRID_SIZE * CELL_SIZE + UI_HEIGHT))
+    screen = pygame.display.set_mode(size or (GRID_SIZE * CELL_SIZE, GRID_SIZE * CELL_SIZE + UI_HEIGHT))
     return screen, font
 
-SCREEN, FONT = init_pygame()
+def get_display(size=None):
+    global SCREEN, FONT, SMALL_FONT
+    if SCREEN is None:
+        SCREEN, FONT = init_pygame(size)
+        SMALL_FONT = pygame.font.Font(None, 18)
+    elif size is not None and SCREEN.get_size() != size:
+        SCREEN = pygame.display.set_mode(size)
+    return SCREEN, FONT
+
+def cell_size_for(grid_size):
+    if grid_size * CELL_SIZE <= MAX_BOARD_PIXELS:
+        return CELL_SIZE
+    return max(1, MAX_BOARD_PIXELS // grid_size)
+
+class Renderer:
+    def __init__(self, grid, cell_size=None, overlay_lines=0):
+        self.grid = grid
+        self.width, self.height = grid.shape
+        self.cell_size = cell_size or cell_size_for(max(grid.shape))
+        self.board_height = self.height * self.cell_size
+        self.overlay_lines = overlay_lines
+        overlay_height = OVERLAY_LINE_HEIGHT * overlay_lines + 6 if overlay_lines else 0
+        self.overlay_rect = pygame.Rect(0, self.board_height + UI_HEIGHT, self.width * self.cell_size, overlay_height)
+        self.screen, self.font = get_display((self.width * self.cell_size, self.board_height + UI_HEIGHT + overlay_height))
+        self.terrain_surface = pygame.Surface((self.width * self.cell_size, self.board_height))
+        self.changed_cells = set()
+        self.agents = {}
+        self.labels = {}
+        self.redraw_terrain()
+        if hasattr(grid, "add_listener"):
+            grid.add_listener(self.notify)
+
+    def detach(self):
+        if hasattr(self.grid, "remove_listener"):
+            self.grid.remove_listener(self.notify)
+
+    def notify(self, cells):
+        self.changed_cells.update(cells)
+
+    def cell_rect(self, cell):
+        return pygame.Rect(cell[0] * self.cell_size, cell[1] * self.cell_size, self.cell_size, self.cell_size)
+
+    def redraw_terrain(self):
+        pixels = pygame.surfarray.make_surface(TERRAIN_COLORS[np.asarray(self.grid)])
+        if self.cell_size == 1:
+            self.terrain_surface.blit(pixels, (0, 0))
+        else:
+            pygame.transform.scale(pixels, self.terrain_surface.get_size(), self.terrain_surface)
+        self.changed_cells.clear()
+        self.agents = {}
+        self.labels = {}
+        self.overlay = None
+        self.screen.fill((255, 255, 255))
+        self.screen.blit(self.terrain_surface, (0, 0))
+        self.full_redraw = True
+
+    def agent_colors(self, player_pos, npc_positions, npc_clusters, enemy_delay):
+        roles = {npc: group_name for group_name, npc_group in npc_clusters.items() for npc in npc_group}
+        colors = {tuple(player_pos): COLORS["player"]}
+        for i, npc in enumerate(npc_positions):
+            role = roles.get(npc, "chaser")
+            colors[npc] = COLORS[f"{role}_delayed"] if enemy_delay[i] > 0 else COLORS[role]
+        return colors
+
+    def draw(self, player_pos, npc_positions, npc_clusters, enemy_delay, modify_cooldown, clear_cooldown, point, remaining_turns, overlay=None):
+        dirty = []
+        for cell in self.changed_cells:
+            rect = self.cell_rect(cell)
+            self.terrain_surface.fill(TERRAIN_COLOR_LIST[self.grid[cell]], rect)
+            self.screen.blit(self.terrain_surface, rect, rect)
+            dirty.append(rect)
+        terrain_changed = self.changed_cells
+        self.changed_cells = set()
+
+        agents = self.agent_colors(player_pos, npc_positions, npc_clusters, enemy_delay)
+        for cell in self.agents.keys() - agents.keys():
+            rect = self.cell_rect(cell)
+            self.screen.blit(self.terrain_surface, rect, rect)
+            dirty.append(rect)
+        for cell, color in agents.items():
+            if self.agents.get(cell) != color or cell in terrain_changed:
+                rect = self.cell_rect(cell)
+                self.screen.fill(color, rect)
+                dirty.append(rect)
+        self.agents = agents
+
+        dirty.extend(self.draw_ui(modify_cooldown, clear_cooldown, point, remaining_turns))
+        if overlay != self.overlay and self.overlay_lines:
+            self.overlay = overlay
+            draw_overlay(self.screen, overlay or [], self.overlay_rect)
+            dirty.append(self.overlay_rect)
+
+        if self.full_redraw:
+            self.full_redraw = False
+            return [self.screen.get_rect()]
+        return dirty
+
+    def draw_ui(self, modify_cooldown, clear_cooldown, point, remaining_turns):
+        texts = (
+            ("mud", f"Mud: {modify_cooldown}"),
+            ("clear", f"Clear: {clear_cooldown}"),
+            ("point", f"POINT: {point}"),
+            ("turns", f"Turns: {remaining_turns}")
+        )
+        changed = False
+        for key, text in texts:
+            if key not in self.labels or self.labels[key][0] != text:
+                self.labels[key] = (text, self.font.render(text, True, (255, 0, 0)))
+                changed = True
+        if not changed:
+            return []
+
+        rect = pygame.Rect(0, self.board_height, self.screen.get_width(), UI_HEIGHT)
+        self.screen.fill((255, 255, 255), rect)
+        x = LABEL_GAP
+        for key, _ in texts:
+            surface = self.labels[key][1]
+            width = surface.get_width() + 2 * LABEL_PADDING
+            if key in BOXED_LABELS:
+                width = max(width, LABEL_BOX_WIDTH)
+                pygame.draw.rect(self.screen, (255, 0, 0), (x, rect.top + 10, width, 40), 2)
+            self.screen.blit(surface, (x + LABEL_PADDING, rect.top + 20))
+            x += width + LABEL_GAP
+        return [rect]
+
+def get_renderer(grid, overlay_lines=0):
+    global RENDERER
+    if RENDERER is None or RENDERER.grid is not grid or RENDERER.overlay_lines < overlay_lines:
+        if RENDERER is not None:
+            RENDERER.detach()
+        RENDERER = Renderer(grid, overlay_lines=overlay_lines)
+    return RENDERER
 
 def handle_events():
+    get_display()
     last_move = None
     modify_skill = False
     last_modify_move = None
@@ -52,54 +190,48 @@ def handle_events():
         if event.type == pygame.QUIT:
             return False, last_move, modify_skill, last_modify_move, clear_skill
         elif event.type == pygame.KEYDOWN and event.key in MOVES:
-            last_move = event.key
+            last_move = MOVES[event.key]
         elif event.type == pygame.KEYDOWN and event.key in MODIFY_KEYS:
             modify_skill = True
-            last_modify_move = event.key
+            last_modify_move = MODIFY_KEYS[event.key]
         elif event.type == pygame.KEYDOWN and event.key == pygame.K_SPACE:
             clear_skill = True
 
     return True, last_move, modify_skill, last_modify_move, clear_skill
 
-def update_screen(grid, player_pos, npc_positions, npc_clusters, enemy_delay, modify_cooldown, clear_cooldown, point, remaining_turns):
-    draw(grid, player_pos, npc_positions, npc_clusters, enemy_delay, modify_cooldown, clear_cooldown, point, remaining_turns)
-    pygame.display.flip()
+def update_screen(grid, player_pos, npc_positions, npc_clusters, enemy_delay, modify_cooldown, clear_cooldown, point, remaining_turns, overlay=None):
+    dirty = draw(grid, player_pos, npc_positions, npc_clusters, enemy_delay, modify_cooldown, clear_cooldown, point, remaining_turns, overlay)
+    pygame.display.update(dirty)
+
+def wait_turn():
     pygame.time.delay(GAME_SPEED)
 
-def draw(grid, player_pos, npc_positions, npc_clusters, enemy_delay, modify_cooldown, clear_cooldown, point, remaining_turns):
-    SCREEN.fill((255, 255, 255))
-    for x in range(GRID_SIZE):
-        for y in range(GRID_SIZE):
-            pygame.draw.rect(SCREEN, COLORS[grid[x, y]], (x * CELL_SIZE, y * CELL_SIZE, CELL_SIZE, CELL_SIZE))
-    pygame.draw.rect(SCREEN, COLORS["player"], (player_pos[0] * CELL_SIZE, player_pos[1] * CELL_SIZE, CELL_SIZE, CELL_SIZE))
-    for i, npc in enumerate(npc_positions):
-        if npc in npc_clusters["chaser"]:
-            color = COLORS["chaser_delayed"] if enemy_delay[i] > 0 else COLORS["chaser"]
-        elif npc in npc_clusters["helper"]:
-            color = COLORS["helper_delayed"] if enemy_delay[i] > 0 else COLORS["helper"]
-        elif npc in npc_clusters["blocker"]:
-            color = COLORS["blocker_delayed"] if enemy_delay[i] > 0 else COLORS["blocker"]
-        else:
-            color = COLORS["chaser_delayed"] if enemy_delay[i] > 0 else COLORS["chaser"]
-        pygame.draw.rect(SCREEN, color, (npc[0] * CELL_SIZE, npc[1] * CELL_SIZE, CELL_SIZE, CELL_SIZE))
-    pygame.draw.rect(SCREEN, (255, 0, 0), (10, GRID_SIZE * CELL_SIZE + 10, 120, 40), 2)
-    pygame.draw.rect(SCREEN, (255, 0, 0), (140, GRID_SIZE * CELL_SIZE + 10, 120, 40), 2)
-    SCREEN.blit(FONT.render(f"Mud: {modify_cooldown}", True, (255, 0, 0)), (20, GRID_SIZE * CELL_SIZE + 20))
-    SCREEN.blit(FONT.render(f"Clear: {clear_cooldown}", True, (255, 0, 0)), (150, GRID_SIZE * CELL_SIZE + 20))
-    SCREEN.blit(FONT.render(f"POINT: {point}", True, (255, 0, 0)), (270, GRID_SIZE * CELL_SIZE + 20))
-    SCREEN.blit(FONT.render(f"Turns: {remaining_turns}", True, (255, 0, 0)), (450, GRID_SIZE * CELL_SIZE + 20))
+def draw(grid, player_pos, npc_positions, npc_clusters, enemy_delay, modify_cooldown, clear_cooldown, point, remaining_turns, overlay=None):
+    renderer = get_renderer(grid, len(overlay) if overlay else 0)
+    return renderer.draw(player_pos, npc_positions, npc_clusters, enemy_delay, modify_cooldown, clear_cooldown, point, remaining_turns, overlay)
+
+def draw_overlay(screen, lines, rect):
+    pygame.draw.rect(screen, (0, 0, 0), rect)
+    for i, line in enumerate(lines):
+        screen.blit(SMALL_FONT.render(line, True, (255, 255, 255)), (rect.left + 4, rect.top + 4 + OVERLAY_LINE_HEIGHT * i))
+    return rect
 
 def show_game_over_screen(score):
+    global RENDERER
+    if RENDERER is not None:
+        RENDERER.detach()
+        RENDERER = None
+    screen, font = get_display()
     game_over = True
     while game_over:
-        SCREEN.fill((0, 0, 0))
-        game_over_text = FONT.render(f"GAMEOVER", True, (255, 0, 0))
-        score_text = FONT.render(f"SCORE: {score}", True, (255, 255, 255))
-        retry_text = FONT.render("Y: RETRY / N: EXIT", True, (255, 255, 255))
-
-        SCREEN.blit(game_over_text, (GRID_SIZE * CELL_SIZE // 2 - 80, GRID_SIZE * CELL_SIZE // 2 - 60))
-        SCREEN.blit(score_text, (GRID_SIZE * CELL_SIZE // 2 - 50, GRID_SIZE * CELL_SIZE // 2 - 20))
-        SCREEN.blit(retry_text, (GRID_SIZE * CELL_SIZE // 2 - 100, GRID_SIZE * CELL_SIZE // 2 + 40))
+        screen.fill((0, 0, 0))
+        game_over_text = font.render(f"GAMEOVER", True, (255, 0, 0))
+        score_text = font.render(f"SCORE: {score}", True, (255, 255, 255))
+        retry_text = font.render("Y: RETRY / N: EXIT", True, (255, 255, 255))
+
+        screen.blit(game_over_text, (GRID_SIZE * CELL_SIZE // 2 - 80, GRID_SIZE * CELL_SIZE // 2 - 60))
+        screen.blit(score_text, (GRID_SIZE * CELL_SIZE // 2 - 50, GRID_SIZE * CELL_SIZE // 2 - 20))
+        screen.blit(retry_text, (GRID_SIZE * CELL_SIZE // 2 - 100, GRID_SIZE * CELL_SIZE // 2 + 40))
 
         pygame.display.flip()
         
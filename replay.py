@@ -0,0 +1,279 @@
+import struct
+from collections import deque
+
+import numpy as np
+
+from agents import ROLE_NAMES
+from settings import DIRECTIONS
+
+MAGIC = b"NPCREPLY"
+VERSION = 1
+HEADER = struct.Struct("<8sHHHHIQQ")
+KEYFRAME_INTERVAL = 256
+KEYFRAME = 1
+ACTIONS = (None,) + tuple(DIRECTIONS)
+ACTION_CODES = {action: code for code, action in enumerate(ACTIONS)}
+EDIT_DTYPE = np.dtype([("x", "<u2"), ("y", "<u2"), ("value", "u1")])
+INDEX_DTYPE = np.dtype([("offset", "<u8"), ("flags", "u1")])
+
+
+def tick_dtype(agent_count):
+    return np.dtype([
+        ("tick", "<u4"),
+        ("flags", "u1"),
+        ("action", "u1", 3),
+        ("player", "<i2", 2),
+        ("point", "<i4"),
+        ("remaining_turns", "<i4"),
+        ("cooldowns", "u1", 2),
+        ("edit_count", "<u4"),
+        ("positions", "<i2", (agent_count, 2)),
+        ("roles", "i1", agent_count),
+        ("delays", "u1", agent_count)
+    ])
+
+
+def apply_payload(terrain, record, payload):
+    if record["flags"] & KEYFRAME:
+        terrain[:] = payload
+    else:
+        terrain[payload["x"], payload["y"]] = payload["value"]
+
+
+class TickCapture:
+    def __init__(self, shape, agent_count, keyframe_interval=KEYFRAME_INTERVAL):
+        self.shape = tuple(shape)
+        self.agent_count = agent_count
+        self.keyframe_interval = keyframe_interval
+        self.dtype = tick_dtype(agent_count)
+        self.grid = None
+        self.changed = set()
+        self.tick = 0
+        self.since_keyframe = 0
+
+    def notify(self, cells):
+        self.changed.update(cells)
+
+    def watch(self, grid):
+        self.detach()
+        self.grid = grid
+        self.changed.clear()
+        if hasattr(grid, "add_listener"):
+            grid.add_listener(self.notify)
+
+    def detach(self):
+        if self.grid is not None and hasattr(self.grid, "remove_listener"):
+            self.grid.remove_listener(self.notify)
+        self.grid = None
+
+    def capture(self, game, action=(None, None, False)):
+        keyframe = (game.grid is not self.grid or not hasattr(game.grid, "add_listener")
+                    or self.since_keyframe >= self.keyframe_interval)
+        if game.grid is not self.grid:
+            self.watch(game.grid)
+
+        record = np.zeros((), dtype=self.dtype)
+        record["tick"] = self.tick
+        record["action"] = (ACTION_CODES[action[0]], ACTION_CODES[action[1]], bool(action[2]))
+        record["player"] = game.player_pos
+        record["point"] = game.point
+        record["remaining_turns"] = game.RemainingTurn
+        record["cooldowns"] = (game.modify_cooldown, game.clear_cooldown)
+        record["positions"] = game.agents.positions
+        record["roles"] = game.agents.roles
+        record["delays"] = np.minimum(game.agents.delays, 255)
+
+        if keyframe:
+            record["flags"] = KEYFRAME
+            payload = np.array(game.grid, dtype=np.uint8)
+            self.since_keyframe = 0
+        else:
+            payload = np.zeros(len(self.changed), dtype=EDIT_DTYPE)
+            if self.changed:
+                cells = np.array(sorted(self.changed))
+                payload["x"], payload["y"] = cells[:, 0], cells[:, 1]
+                payload["value"] = np.asarray(game.grid)[cells[:, 0], cells[:, 1]]
+            record["edit_count"] = len(payload)
+        self.changed = set()
+        self.tick += 1
+        self.since_keyframe += 1
+        return record, payload
+
+
+class ReplayRecorder(TickCapture):
+    def __init__(self, path, shape, agent_count, keyframe_interval=KEYFRAME_INTERVAL):
+        super().__init__(shape, agent_count, keyframe_interval)
+        self.path = path
+        self.file = open(path, "wb")
+        self.index = []
+        self.offset = HEADER.size
+        self.write_header(0, 0)
+
+    def write_header(self, tick_count, index_offset):
+        self.file.write(HEADER.pack(MAGIC, VERSION, self.shape[0], self.shape[1], self.agent_count,
+                                    self.keyframe_interval, tick_count, index_offset))
+
+    def record(self, game, action=(None, None, False)):
+        self.write(*self.capture(game, action))
+
+    def write(self, record, payload):
+        self.index.append((self.offset, record["flags"]))
+        record_bytes = record.tobytes()
+        payload_bytes = payload.tobytes()
+        self.file.write(record_bytes)
+        self.file.write(payload_bytes)
+        self.offset += len(record_bytes) + len(payload_bytes)
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.detach()
+        self.file.write(np.array(self.index, dtype=INDEX_DTYPE).tobytes())
+        self.file.seek(0)
+        self.write_header(len(self.index), self.offset)
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ReplayBuffer(TickCapture):
+    def __init__(self, capacity, shape, agent_count, keyframe_interval=KEYFRAME_INTERVAL):
+        super().__init__(shape, agent_count, keyframe_interval)
+        self.capacity = capacity
+        self.frames = deque()
+        self.base = np.zeros(self.shape, dtype=np.uint8)
+
+    def record(self, game, action=(None, None, False)):
+        self.frames.append(self.capture(game, action))
+        if len(self.frames) > self.capacity:
+            self.frames.popleft()
+        elif len(self.frames) > 1:
+            return
+        apply_payload(self.base, *self.frames[0])
+
+    def dump(self, path):
+        with ReplayRecorder(path, self.shape, self.agent_count, self.keyframe_interval) as recorder:
+            for i, (record, payload) in enumerate(self.frames):
+                if i == 0:
+                    record = record.copy()
+                    record["flags"] |= KEYFRAME
+                    record["edit_count"] = 0
+                    payload = self.base
+                recorder.write(record, payload)
+        return len(self.frames)
+
+
+class ReplayReader:
+    def __init__(self, path):
+        self.data = np.memmap(path, dtype=np.uint8, mode="r")
+        magic, version, width, height, agent_count, self.keyframe_interval, tick_count, index_offset = \
+            HEADER.unpack(self.data[:HEADER.size].tobytes())
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} replay")
+        self.shape = (width, height)
+        self.agent_count = agent_count
+        self.dtype = tick_dtype(agent_count)
+        if index_offset and index_offset + tick_count * INDEX_DTYPE.itemsize <= len(self.data):
+            self.index = self.data[index_offset:index_offset + tick_count * INDEX_DTYPE.itemsize].view(INDEX_DTYPE)
+        else:
+            self.index = self.scan()
+        self.keyframes = np.flatnonzero(self.index["flags"] & KEYFRAME)
+
+    def scan(self):
+        index = []
+        offset = HEADER.size
+        terrain_size = self.shape[0] * self.shape[1]
+        while offset + self.dtype.itemsize <= len(self.data):
+            record = self.data[offset:offset + self.dtype.itemsize].view(self.dtype)[0]
+            size = terrain_size if record["flags"] & KEYFRAME else int(record["edit_count"]) * EDIT_DTYPE.itemsize
+            if offset + self.dtype.itemsize + size > len(self.data):
+                break
+            index.append((offset, record["flags"]))
+            offset += self.dtype.itemsize + size
+        return np.array(index, dtype=INDEX_DTYPE)
+
+    def __len__(self):
+        return len(self.index)
+
+    def record(self, tick):
+        offset = int(self.index["offset"][tick])
+        return self.data[offset:offset + self.dtype.itemsize].view(self.dtype)[0]
+
+    def payload(self, tick):
+        record = self.record(tick)
+        start = int(self.index["offset"][tick]) + self.dtype.itemsize
+        if record["flags"] & KEYFRAME:
+            return self.data[start:start + self.shape[0] * self.shape[1]].reshape(self.shape)
+        return self.data[start:start + int(record["edit_count"]) * EDIT_DTYPE.itemsize].view(EDIT_DTYPE)
+
+    def apply(self, terrain, tick):
+        apply_payload(terrain, self.record(tick), self.payload(tick))
+
+    def terrain(self, tick):
+        keyframe = self.keyframes[np.searchsorted(self.keyframes, tick, side="right") - 1]
+        terrain = np.array(self.payload(keyframe))
+        for t in range(keyframe + 1, tick + 1):
+            self.apply(terrain, t)
+        return terrain
+
+    def state(self, tick):
+        record = self.record(tick)
+        positions = list(map(tuple, record["positions"].tolist()))
+        clusters = {name: [] for name in ROLE_NAMES}
+        for pos, role in zip(positions, record["roles"].tolist()):
+            clusters[ROLE_NAMES[role]].append(pos)
+        move, mud_direction, clear = record["action"].tolist()
+        return {
+            "tick": int(record["tick"]),
+            "action": (ACTIONS[move], ACTIONS[mud_direction], bool(clear)),
+            "player_pos": tuple(record["player"].tolist()),
+            "npc_positions": positions,
+            "npc_clusters": clusters,
+            "enemy_delay": record["delays"].tolist(),
+            "point": int(record["point"]),
+            "remaining_turns": int(record["remaining_turns"]),
+            "modify_cooldown": int(record["cooldowns"][0]),
+            "clear_cooldown": int(record["cooldowns"][1])
+        }
+
+    def frames(self, start=0):
+        if start >= len(self):
+            return
+        terrain = self.terrain(start)
+        for tick in range(start, len(self)):
+            if tick > start:
+                self.apply(terrain, tick)
+            yield self.state(tick), terrain
+
+
+def play(path, start=0):
+    from pygame_running_and_display import handle_events, update_screen, wait_turn, quit_game
+    from terrain import TerrainGrid
+
+    reader = ReplayReader(path)
+    grid = None
+    for state, terrain in reader.frames(start):
+        if grid is None:
+            grid = TerrainGrid(np.zeros(reader.shape, dtype=np.uint8))
+        grid[:] = terrain
+        running = handle_events()[0]
+        if not running:
+            break
+        update_screen(grid, state["player_pos"], state["npc_positions"], state["npc_clusters"], state["enemy_delay"],
+                      state["modify_cooldown"], state["clear_cooldown"], state["point"], state["remaining_turns"])
+        wait_turn()
+    quit_game()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Play back a recorded game.")
+    parser.add_argument("path")
+    parser.add_argument("--start", type=int, default=0, help="tick to start playback from")
+    args = parser.parse_args()
+    play(args.path, args.start)
@@ -0,0 +1,214 @@
+import heapq
+
+from terrain import TERRAIN_COST_LIST, TERRAIN_DELAY_LIST
+
+INF = float("inf")
+MOVE_DIRECTIONS = [(-1, 0), (1, 0), (0, -1), (0, 1)]
+
+
+class ReservedPath:
+    def __init__(self, cells, start, group, goal):
+        self.cells = cells
+        self.start = start
+        self.group = group
+        self.goal = goal
+
+    def remaining(self, time):
+        return self.cells[time - self.start:]
+
+
+class ReservationTable:
+    def __init__(self, grid=None, window=8, replan_margin=None):
+        self.window = window
+        self.replan_margin = window // 2 if replan_margin is None else replan_margin
+        self.time = 0
+        self.paths = {}
+        self.reserved = {}
+        self.changed_cells = set()
+        self.invalidated = set()
+        self.stale = set()
+        self.grid = None
+        if grid is not None:
+            self.watch(grid)
+
+    def copy(self, grid):
+        clone = ReservationTable(grid, self.window, self.replan_margin)
+        clone.restore(self.snapshot())
+        clone.invalidated = set(self.invalidated)
+        clone.stale = set(self.stale)
+        return clone
+
+    def watch(self, grid):
+        if grid is self.grid:
+            return
+        if hasattr(self.grid, "remove_listener"):
+            self.grid.remove_listener(self.notify)
+        self.grid = grid
+        self.paths = {}
+        if hasattr(grid, "add_listener"):
+            grid.add_listener(self.notify)
+
+    def notify(self, cells):
+        self.changed_cells.update(cells)
+
+    def snapshot(self):
+        return self.time, dict(self.paths), dict(self.reserved), set(self.changed_cells)
+
+    def restore(self, state):
+        time, paths, reserved, changed_cells = state
+        self.time = time
+        self.paths = dict(paths)
+        self.reserved = dict(reserved)
+        self.changed_cells = set(changed_cells)
+
+    def begin_tick(self, npc_positions, clustered_npcs, target_positions, delays, keep_stale=False):
+        self.time += 1
+        roles = {npc: group_name for group_name, npc_group in clustered_npcs.items() for npc in npc_group}
+        kept = {}
+        self.invalidated = set()
+        self.stale = set()
+        for path in self.paths.values():
+            remaining = path.remaining(self.time)
+            if len(remaining) <= self.replan_margin:
+                continue
+            npc = remaining[0]
+            if roles.get(npc) != path.group:
+                continue
+            if self.changed_cells and any(cell in self.changed_cells for cell in remaining):
+                self.invalidated.add(npc)
+                continue
+            if target_positions[path.group] != path.goal:
+                if not keep_stale:
+                    continue
+                self.stale.add(npc)
+            kept[npc] = path
+        self.changed_cells = set()
+
+        self.paths = {}
+        self.reserved = {}
+        for npc in npc_positions:
+            for t in range(delays.get(npc, 0) + 1):
+                self.reserved[(npc, self.time + t)] = npc
+        for npc, path in kept.items():
+            self.reserve(npc, path)
+
+    def reserve(self, npc, path):
+        self.paths[npc] = path
+        for offset, cell in enumerate(path.remaining(self.time)):
+            self.reserved[(cell, self.time + offset)] = npc
+
+    def release(self, npc):
+        path = self.paths.pop(npc, None)
+        if path is None:
+            return
+        for offset, cell in enumerate(path.remaining(self.time)):
+            if self.reserved.get((cell, self.time + offset)) == npc:
+                del self.reserved[(cell, self.time + offset)]
+
+    def is_free(self, cell, time, npc):
+        return self.reserved.get((cell, time), npc) == npc
+
+    def can_enter(self, cell, arrive, leave, npc):
+        if not self.is_free(cell, arrive - 1, npc):
+            return False
+        return all(self.is_free(cell, t, npc) for t in range(arrive, leave + 1))
+
+    def path_for(self, npc):
+        return self.paths.get(npc)
+
+
+def stride_moves(grid, pos, stride, goal):
+    width, height = grid.shape
+    frontier = {pos}
+    seen = {pos}
+    moves = []
+    for step in range(stride):
+        next_frontier = set()
+        for x, y in frontier:
+            for dx, dy in MOVE_DIRECTIONS:
+                nx, ny = x + dx, y + dy
+                if not (0 <= nx < width and 0 <= ny < height) or (nx, ny) in seen:
+                    continue
+                if TERRAIN_COST_LIST[grid[nx, ny]] == INF:
+                    continue
+                seen.add((nx, ny))
+                next_frontier.add((nx, ny))
+                if step == stride - 1 or (nx, ny) == goal:
+                    moves.append((nx, ny))
+        frontier = next_frontier
+    return moves
+
+
+def windowed_astar(grid, npc, delay, field, reached, table, stride=1, stats=None):
+    now = table.time
+    horizon = now + table.window
+    start_time = now + delay
+    goal = field.goal
+
+    def heuristic(pos):
+        return field.distance(pos) / stride
+
+    def finish(cells, expanded, pushes, stale_pops, failed):
+        if stats is not None:
+            stats.searches += 1
+            stats.expanded += expanded
+            stats.pushes += pushes
+            stats.stale_pops += stale_pops
+            stats.path_length += len(cells) - 1
+            stats.failures += failed
+        return cells
+
+    if heuristic(npc) == INF:
+        return finish([npc] * (delay + 1), 0, 0, 0, True)
+
+    open_set = [(start_time + heuristic(npc), start_time, npc)]
+    came_from = {}
+    closed = set()
+    expanded = stale_pops = 0
+    pushes = 1
+    while open_set:
+        _, time, pos = heapq.heappop(open_set)
+        if (pos, time) in closed:
+            stale_pops += 1
+            continue
+        closed.add((pos, time))
+        expanded += 1
+
+        if time >= horizon or reached(pos):
+            return finish(reconstruct_timed_path(came_from, npc, now, pos, time, table), expanded, pushes, stale_pops, False)
+
+        if table.is_free(pos, time + 1, npc):
+            state = (pos, time + 1)
+            if state not in closed:
+                came_from.setdefault(state, (pos, time))
+                heapq.heappush(open_set, (time + 1 + heuristic(pos), time + 1, pos))
+                pushes += 1
+
+        for neighbor in stride_moves(grid, pos, stride, goal):
+            h = heuristic(neighbor)
+            if h == INF:
+                continue
+            arrive = time + 1
+            leave = arrive + TERRAIN_DELAY_LIST[grid[neighbor]]
+            state = (neighbor, leave)
+            if state in closed or not table.can_enter(neighbor, arrive, leave, npc):
+                continue
+            came_from.setdefault(state, (pos, time))
+            heapq.heappush(open_set, (leave + h, leave, neighbor))
+            pushes += 1
+    return finish([npc] * (delay + 1), expanded, pushes, stale_pops, True)
+
+
+def reconstruct_timed_path(came_from, npc, now, pos, time, table):
+    states = [(pos, time)]
+    while states[-1] in came_from:
+        states.append(came_from[states[-1]])
+    states.reverse()
+
+    cells = [npc] * (states[0][1] - now + 1)
+    for cell, time in states[1:]:
+        cells.extend([cell] * (time - now + 1 - len(cells)))
+
+    while len(cells) <= table.window and table.is_free(cells[-1], now + len(cells), npc):
+        cells.append(cells[-1])
+    return cells
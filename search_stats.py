@@ -0,0 +1,48 @@
+COUNTERS = ("searches", "expanded", "pushes", "stale_pops", "path_length", "failures")
+
+
+class SearchCounters:
+    __slots__ = COUNTERS
+
+    def __init__(self):
+        for name in COUNTERS:
+            setattr(self, name, 0)
+
+    def finish(self, path, failed=None):
+        self.searches += 1
+        self.path_length += len(path)
+        if failed is None:
+            failed = not path
+        self.failures += bool(failed)
+
+    def add(self, other):
+        for name in COUNTERS:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in COUNTERS}
+
+
+class SearchStats:
+    def __init__(self):
+        self.roles = {}
+
+    def role(self, name):
+        if name not in self.roles:
+            self.roles[name] = SearchCounters()
+        return self.roles[name]
+
+    def total(self):
+        total = SearchCounters()
+        for counters in self.roles.values():
+            total.add(counters)
+        return total
+
+    def merge(self, other):
+        for name, counters in other.roles.items():
+            self.role(name).add(counters)
+
+    def as_dict(self):
+        stats = {name: counters.as_dict() for name, counters in self.roles.items()}
+        stats["total"] = self.total().as_dict()
+        return stats
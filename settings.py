@@ -0,0 +1,13 @@
+GRID_SIZE = 30
+CELL_SIZE = 20
+UI_HEIGHT = 50
+GAME_SPEED = 500
+
+DIRECTIONS = {
+    "up": (0, -1),
+    "down": (0, 1),
+    "left": (-1, 0),
+    "right": (1, 0)
+}
+MOVES = DIRECTIONS
+MODIFY_KEYS = DIRECTIONS
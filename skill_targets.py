@@ -0,0 +1,106 @@
+import numpy as np
+
+from terrain import EMPTY, MUD, WATER, WALL
+
+SKILL_RANGE = 5
+DIAMOND_OFFSETS = np.array([(dx, dy) for dx in range(-SKILL_RANGE, SKILL_RANGE + 1)
+                            for dy in range(-SKILL_RANGE, SKILL_RANGE + 1) if abs(dx) + abs(dy) <= SKILL_RANGE])
+DIAMOND_DISTANCE = np.abs(DIAMOND_OFFSETS).sum(axis=1)
+NO_TARGET, SET_MUD, CLEAR_TERRAIN, PLACE_WALL = range(4)
+UNREACHABLE = 1 << 20
+
+
+class DiamondArea:
+    def __init__(self, grid, occupancy, center):
+        width, height = grid.shape
+        self.cells = np.asarray(center) + DIAMOND_OFFSETS
+        self.inside = ((self.cells >= 0) & (self.cells < (width, height))).all(axis=1)
+        x = np.clip(self.cells[:, 0], 0, width - 1)
+        y = np.clip(self.cells[:, 1], 0, height - 1)
+        self.terrain = np.asarray(grid)[x, y].copy()
+        self.free = self.inside & (occupancy[x, y] < 0)
+        self.slots = {(int(cx), int(cy)): k for k, (cx, cy) in enumerate(self.cells.tolist()) if self.inside[k]}
+
+    def near(self, positions):
+        distance = np.abs(self.cells[None, :, :] - np.asarray(positions).reshape(-1, 1, 2)).sum(axis=2)
+        return self.inside & (distance <= SKILL_RANGE)
+
+    def update(self, cell, value):
+        slot = self.slots.get(cell)
+        if slot is not None:
+            self.terrain[slot] = value
+        return slot
+
+    def cell(self, slot):
+        return tuple(int(c) for c in self.cells[slot])
+
+
+class SkillPlanner:
+    def __init__(self, grid, occupancy, player_pos, player_tendency, blocker_target, helpers, helper_positions, blockers, blocker_positions):
+        self.grid = grid
+        self.player_area = DiamondArea(grid, occupancy, player_pos)
+        self.target_area = DiamondArea(grid, occupancy, blocker_target)
+        dot = DIAMOND_OFFSETS[:, 0] * player_tendency[0] + DIAMOND_OFFSETS[:, 1] * player_tendency[1]
+        self.mud_side = (dot >= 0) & (DIAMOND_DISTANCE >= SKILL_RANGE - 1)
+        self.clear_side = dot < 0
+
+        self.helper_rows = {agent: row for row, agent in enumerate(helpers)}
+        self.helper_near = self.player_area.near(helper_positions)
+        self.helper_plans = self.plan_helpers(np.arange(len(helpers)))
+        self.stale_helpers = np.zeros(len(helpers), dtype=bool)
+
+        self.blocker_rows = {agent: row for row, agent in enumerate(blockers)}
+        self.blocker_near = self.target_area.near(blocker_positions)
+        self.blocker_plans = self.plan_blockers(np.arange(len(blockers)))
+        self.stale_blockers = np.zeros(len(blockers), dtype=bool)
+
+        if hasattr(grid, "add_listener"):
+            grid.add_listener(self.notify)
+
+    def detach(self):
+        if hasattr(self.grid, "remove_listener"):
+            self.grid.remove_listener(self.notify)
+
+    def notify(self, cells):
+        for cell in cells:
+            value = self.grid[cell]
+            slot = self.player_area.update(cell, value)
+            if slot is not None:
+                self.stale_helpers |= self.helper_near[:, slot]
+            slot = self.target_area.update(cell, value)
+            if slot is not None:
+                self.stale_blockers |= self.blocker_near[:, slot]
+
+    def plan_helpers(self, rows):
+        area = self.player_area
+        near = self.helper_near[rows] & area.free
+        set_mud = near & self.mud_side & (area.terrain == EMPTY)
+        clear = near & self.clear_side & ((area.terrain == MUD) | (area.terrain == WATER))
+        mud_slot = np.argmin(np.where(set_mud, DIAMOND_DISTANCE, UNREACHABLE), axis=1)
+        clear_slot = np.argmin(np.where(clear, DIAMOND_DISTANCE, UNREACHABLE), axis=1)
+        has_mud = set_mud.any(axis=1)
+        kind = np.where(has_mud, SET_MUD, np.where(clear.any(axis=1), CLEAR_TERRAIN, NO_TARGET))
+        return np.stack([kind, np.where(has_mud, mud_slot, clear_slot)], axis=1)
+
+    def plan_blockers(self, rows):
+        area = self.target_area
+        near = self.blocker_near[rows] & (area.terrain != WALL)
+        score = np.where(near, 3 * (area.terrain == EMPTY) - DIAMOND_DISTANCE, -UNREACHABLE)
+        kind = np.where(near.any(axis=1), PLACE_WALL, NO_TARGET)
+        return np.stack([kind, np.argmax(score, axis=1)], axis=1)
+
+    def helper_target(self, agent):
+        row = self.helper_rows[agent]
+        if self.stale_helpers[row]:
+            self.helper_plans[row] = self.plan_helpers([row])[0]
+            self.stale_helpers[row] = False
+        kind, slot = self.helper_plans[row]
+        return kind, self.player_area.cell(slot) if kind != NO_TARGET else None
+
+    def blocker_target(self, agent):
+        row = self.blocker_rows[agent]
+        if self.stale_blockers[row]:
+            self.blocker_plans[row] = self.plan_blockers([row])[0]
+            self.stale_blockers[row] = False
+        kind, slot = self.blocker_plans[row]
+        return kind, self.target_area.cell(slot) if kind != NO_TARGET else None
@@ -0,0 +1,96 @@
+import weakref
+
+import numpy as np
+
+from cooperative_astar import copy_path_fields
+
+NO_CELLS = np.zeros((0, 2), dtype=np.int64)
+
+
+class TerrainOverlay:
+    def __init__(self, grid, base=None):
+        self.grid = grid
+        self.base = np.array(grid, dtype=np.uint8) if base is None else base
+        self.base.flags.writeable = False
+        self.cells = set()
+        grid.add_listener(self.notify)
+
+    def copy(self, grid):
+        clone = TerrainOverlay(grid, self.base)
+        clone.cells = set(self.cells)
+        return clone
+
+    def notify(self, cells):
+        self.cells.update(cells)
+
+    def detach(self):
+        self.grid.remove_listener(self.notify)
+
+    def edits(self):
+        if not self.cells:
+            return NO_CELLS, np.zeros(0, dtype=np.uint8)
+        cells = np.array(sorted(self.cells), dtype=np.int64)
+        values = np.asarray(self.grid)[cells[:, 0], cells[:, 1]]
+        edited = values != self.base[cells[:, 0], cells[:, 1]]
+        cells, values = cells[edited], values[edited]
+        self.cells = set(map(tuple, cells.tolist()))
+        return cells, values
+
+    def apply(self, cells, values):
+        current = self.edits()[0]
+        targets = dict(zip(map(tuple, current.tolist()), self.base[current[:, 0], current[:, 1]].tolist()))
+        targets.update(zip(map(tuple, cells.tolist()), values.tolist()))
+        if not targets:
+            return
+        xs, ys = np.array(list(targets), dtype=np.int64).T
+        values = np.array(list(targets.values()), dtype=np.uint8)
+        changed = np.asarray(self.grid)[xs, ys] != values
+        if changed.any():
+            self.grid[xs[changed], ys[changed]] = values[changed]
+
+
+class SharedLevel:
+    def __init__(self, game):
+        self.base = game.terrain.base
+        self.edit_cells, self.edit_values = game.terrain.edits()
+        self.connectivity = game.connectivity
+        self.path_fields = game.path_fields
+        self.reservations = game.reservations
+        self.forks = weakref.WeakSet()
+        self.grid = game.grid
+        self.grid.listeners.insert(0, self.freeze)
+
+    def freeze(self, cells=None):
+        if self.grid is None:
+            return
+        self.grid.remove_listener(self.freeze)
+        if self.forks:
+            grid = np.asarray(self.grid)
+            self.connectivity = self.connectivity.copy(grid)
+            self.path_fields = copy_path_fields(self.path_fields, grid)
+            self.reservations = self.reservations.copy(None)
+        self.grid = None
+
+
+class GameSnapshot:
+    def __init__(self, game):
+        self.terrain_base = game.terrain.base
+        self.edit_cells, self.edit_values = game.terrain.edits()
+        self.player_pos = game.player_pos
+        self.positions = game.agents.positions.copy()
+        self.roles = game.agents.roles.copy()
+        self.delays = game.agents.delays.copy()
+        self.role_manager = game.role_manager.snapshot()
+        self.respawned = tuple(game.respawned)
+        self.reservations = game.reservations.snapshot()
+        self.path_fields = copy_path_fields(game.path_fields, np.asarray(game.grid))
+        self.player_history = tuple(game.player_history)
+        self.player_tendency = game.player_tendency
+        self.player_delay = game.player_delay
+        self.point = game.point
+        self.captures = game.captures
+        self.kills = game.kills
+        self.remaining_turns = game.RemainingTurn
+        self.modify_cooldown = game.modify_cooldown
+        self.clear_cooldown = game.clear_cooldown
+        self.turn_count = game.turn_count
@@ -0,0 +1,104 @@
+import numpy as np
+
+EMPTY = 0
+MUD = 1
+WATER = 2
+WALL = 3
+
+# code, name, move cost, delay (turns), color, spawn probability
+TERRAIN_TABLE = (
+    (EMPTY, "empty", 1, 0, (200, 200, 200), 0.7),
+    (MUD, "mud", 2, 1, (139, 69, 19), 0.15),
+    (WATER, "water", 3, 2, (30, 144, 255), 0.1),
+    (WALL, "wall", float("inf"), 0, (0, 0, 0), 0.05),
+)
+
+TERRAIN_NAMES = tuple(row[1] for row in TERRAIN_TABLE)
+TERRAIN_CODES = {row[1]: row[0] for row in TERRAIN_TABLE}
+
+TERRAIN_COST_LIST = [row[2] for row in TERRAIN_TABLE]
+TERRAIN_DELAY_LIST = [row[3] for row in TERRAIN_TABLE]
+TERRAIN_COLOR_LIST = [row[4] for row in TERRAIN_TABLE]
+TERRAIN_PROBABILITIES = [row[5] for row in TERRAIN_TABLE]
+
+TERRAIN_COST = np.array(TERRAIN_COST_LIST, dtype=np.float64)
+TERRAIN_DELAY = np.array(TERRAIN_DELAY_LIST, dtype=np.uint8)
+TERRAIN_COLORS = np.array(TERRAIN_COLOR_LIST, dtype=np.uint8)
+PASSABLE = np.isfinite(TERRAIN_COST)
+
+
+def terrain_code(value):
+    if isinstance(value, str):
+        return TERRAIN_CODES[value]
+    return int(value)
+
+
+def terrain_name(code):
+    return TERRAIN_NAMES[terrain_code(code)]
+
+
+def encode_terrain(grid):
+    grid = np.asarray(grid)
+    if grid.dtype == np.uint8:
+        return grid
+    if np.issubdtype(grid.dtype, np.integer):
+        return grid.astype(np.uint8)
+    codes = np.full(grid.shape, EMPTY, dtype=np.uint8)
+    for name, code in TERRAIN_CODES.items():
+        codes[grid == name] = code
+    return codes
+
+
+def decode_terrain(grid):
+    return np.array(TERRAIN_NAMES)[np.asarray(grid)]
+
+
+def random_terrain(size, p=TERRAIN_PROBABILITIES):
+    return np.random.choice(len(TERRAIN_TABLE), size=size, p=p).astype(np.uint8)
+
+
+class TerrainGrid(np.ndarray):
+    def __new__(cls, cells):
+        return np.array(encode_terrain(cells), dtype=np.uint8).view(cls)
+
+    def __array_finalize__(self, obj):
+        self.listeners = []
+
+    def __array_wrap__(self, array, context=None, return_scalar=False):
+        if return_scalar:
+            return array[()]
+        return np.asarray(array)
+
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self.listeners:
+            self.listeners.remove(callback)
+
+    def __setitem__(self, key, value):
+        if isinstance(value, str):
+            value = TERRAIN_CODES[value]
+        if not self.listeners:
+            super().__setitem__(key, value)
+            return
+
+        cells = self.view(np.ndarray)
+        if isinstance(key, tuple) and len(key) == 2 and all(isinstance(i, (int, np.integer)) for i in key):
+            before = cells[key]
+            cells[key] = value
+            x, y = int(key[0]) % self.shape[0], int(key[1]) % self.shape[1]
+            changed = [(x, y)] if cells[x, y] != before else []
+        else:
+            if isinstance(key, tuple) and len(key) == 2 and all(isinstance(i, np.ndarray) and i.dtype.kind in "iu" for i in key):
+                index = np.ravel_multi_index(key, self.shape, mode="wrap").ravel()
+            else:
+                index = np.arange(self.size).reshape(self.shape)[key].ravel()
+            before = cells.ravel()[index]
+            cells[key] = value
+            index = index[cells.ravel()[index] != before]
+            changed = [divmod(int(i), self.shape[1]) for i in index]
+
+        if changed:
+            for callback in list(self.listeners):
+                callback(changed)
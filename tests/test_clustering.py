@@ -0,0 +1,60 @@
+import numpy as np
+
+from main import GameEnvironment
+from npc_clustering import REGROUP_DRIFT
+
+SPOTS = [(3, 3), (15, 15), (27, 27)]
+OFFSETS = [(0, 0), (0, 1), (1, 0), (1, 1)]
+
+
+def clustered_game():
+    game = GameEnvironment(grid_size=30, enemy_number=12)
+    game.grid[:, :] = 0
+    game.player_pos = (0, 29)
+    place(game, [SPOTS[agent // 4] for agent in range(12)])
+    game.role_manager.centroids = np.array(SPOTS)
+    game.regroup()
+    game.turn_count = 1
+    return game
+
+
+def place(game, spots, shift=(0, 0)):
+    positions = [(x + dx + shift[0], y + dy + shift[1]) for (x, y), (dx, dy) in zip(spots, OFFSETS * 3)]
+    game.agents.restore(positions, game.agents.roles, game.agents.delays)
+
+
+def scatter(game):
+    place(game, [SPOTS[(agent // 4 + (agent % 4 >= 2)) % 3] for agent in range(12)], (1, -1))
+
+
+def test_drift_counts_agents_closer_to_another_cluster():
+    game = clustered_game()
+    assert game.role_manager.drift(game.agents.positions) == 0
+    scatter(game)
+    assert game.role_manager.drift(game.agents.positions) > REGROUP_DRIFT
+
+
+def test_drift_triggers_early_regroup(monkeypatch):
+    game = clustered_game()
+    monkeypatch.setattr(game, "update_enemy_position", lambda: None)
+    monkeypatch.setattr(game, "enemy_skill", lambda: None)
+    scatter(game)
+    labels = game.role_manager.labels.copy()
+    game.step((None, None, False))
+    assert game.turn_count == 1
+    assert game.role_manager.drift(game.agents.positions) == 0
+    assert not np.array_equal(game.role_manager.labels, labels)
+
+
+def test_respawned_agent_joins_nearest_cluster_before_enemies_move(monkeypatch):
+    game = clustered_game()
+    roles = []
+    monkeypatch.setattr(game, "update_enemy_position", lambda: roles.append(int(game.agents.roles[0])))
+    monkeypatch.setattr(game, "enemy_skill", lambda: None)
+    nearest = next(agent for agent in range(12) if game.role_manager.labels[agent] != game.role_manager.labels[0])
+    x, y = game.agents.position(nearest)
+    game.agents.move(0, (x + 2, y - 1))
+    game.respawned.append(0)
+    game.step((None, None, False))
+    assert roles == [int(game.agents.roles[nearest])]
+
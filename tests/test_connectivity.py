@@ -0,0 +1,39 @@
+import numpy as np
+
+from connectivity import ConnectivityIndex
+from main import GameEnvironment
+from terrain import TerrainGrid, WALL
+
+
+def string_grid():
+    grid = np.full((5, 5), "empty", dtype=object)
+    grid[2, :] = "wall"
+    grid[0, 0] = "mud"
+    grid[4, 4] = "water"
+    return grid
+
+
+def test_string_grid_matches_encoded_grid():
+    grid = string_grid()
+    index = ConnectivityIndex(grid, watch=False)
+    assert index.label((2, 3)) == -1
+    assert index.connected((0, 0), (1, 4))
+    assert not index.connected((0, 0), (4, 4))
+    encoded = ConnectivityIndex(np.where(grid == "wall", WALL, 0).astype(np.uint8), watch=False)
+    assert [label >= 0 for label in index.labels] == [label >= 0 for label in encoded.labels]
+
+
+def test_is_map_valid_accepts_string_grid():
+    game = GameEnvironment(grid_size=5, enemy_number=2)
+    grid = string_grid()
+    assert game.is_map_valid(grid, (0, 0), [(1, 1), (0, 4)])
+    assert not game.is_map_valid(grid, (0, 0), [(1, 1), (4, 4)])
+
+
+def test_wall_edit_splits_component():
+    grid = TerrainGrid(np.zeros((5, 5), dtype=np.uint8))
+    index = ConnectivityIndex(grid)
+    grid[2, :] = WALL
+    assert not index.connected((0, 0), (4, 4))
+    grid[2, 3] = 0
+    assert index.connected((0, 0), (4, 4))
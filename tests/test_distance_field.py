@@ -0,0 +1,40 @@
+import random
+
+import numpy as np
+
+from distance_field import DistanceField, IncrementalDistanceField
+from terrain import TerrainGrid, random_terrain
+
+
+def check(field, grid, goal):
+    expected = DistanceField(np.asarray(grid), goal)
+    for x in range(grid.shape[0]):
+        for y in range(grid.shape[1]):
+            assert field.distance((x, y)) == expected.distance((x, y)), (goal, (x, y))
+
+
+def test_incremental_field_matches_dijkstra_after_random_edits():
+    rng = random.Random(7)
+    np.random.seed(7)
+    grid = TerrainGrid(random_terrain((16, 16)))
+    goal = (8, 8)
+    field = IncrementalDistanceField(grid, goal)
+    for step in range(60):
+        for _ in range(rng.randint(1, 6)):
+            grid[rng.randrange(16), rng.randrange(16)] = rng.randrange(4)
+        if step % 3 == 0:
+            goal = (rng.randrange(16), rng.randrange(16))
+        targets = [(rng.randrange(16), rng.randrange(16)) for _ in range(4)]
+        field.update(goal, targets)
+        if step % 5 == 0:
+            check(field, grid, goal)
+    check(field, grid, goal)
+
+
+def test_edits_after_goal_move_repair_incrementally():
+    grid = TerrainGrid(np.zeros((12, 12), dtype=np.uint8))
+    field = IncrementalDistanceField(grid, (0, 0))
+    field.update((6, 6), [(11, 11)])
+    grid[5, 0:11] = 3
+    field.update((6, 6), [(0, 0)])
+    check(field, grid, (6, 6))
@@ -0,0 +1,42 @@
+import random
+
+import numpy as np
+
+from main import GameEnvironment
+from terrain import WALL
+
+ACTIONS = [("down", None, False), ("right", "down", False), ("up", None, True), ("left", None, False)] * 3
+
+
+def play(game, seed=7):
+    random.seed(seed)
+    for action in ACTIONS:
+        game.step(action)
+    return np.array(game.grid).tobytes(), game.player_pos, game.npc_positions, game.agents.delays.tolist(), game.point
+
+
+def started_game(grid_size):
+    random.seed(3)
+    game = GameEnvironment(grid_size=grid_size, enemy_number=10)
+    play(game, 5)
+    return game
+
+
+def test_fork_replays_parent_after_parent_moves_first():
+    for grid_size in (20, 128):
+        game = started_game(grid_size)
+        child = game.fork()
+        grandchild = child.fork()
+        expected = play(game)
+        assert play(child) == expected
+        assert play(grandchild) == expected
+
+
+def test_fork_keeps_terrain_from_before_a_parent_edit():
+    game = started_game(20)
+    child = game.fork()
+    grid = np.array(game.grid)
+    x, y = np.argwhere(grid != WALL)[0]
+    game.grid[x, y] = WALL
+    assert np.array_equal(child.grid, grid)
+    assert len(game.grid.listeners) == len(child.grid.listeners)
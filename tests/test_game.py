@@ -0,0 +1,20 @@
+import main
+from main import GameEnvironment
+from terrain import EMPTY, WATER, TERRAIN_DELAY_LIST
+
+
+def test_captured_agent_takes_delay_of_respawn_cell(monkeypatch):
+    game = GameEnvironment(grid_size=8, enemy_number=1)
+    game.grid[:, :] = EMPTY
+    game.player_pos = (4, 4)
+    game.grid[5, 4] = WATER
+    game.agents.move(0, (6, 4))
+    game.agents.delays[0] = 0
+    monkeypatch.setattr(main, "cooperative_astar", lambda *args, **kwargs: {(6, 4): (5, 4)})
+
+    game.update_enemy_position()
+
+    position = game.agents.position(0)
+    assert game.captures == 1
+    assert position != (5, 4)
+    assert game.agents.delays[0] == TERRAIN_DELAY_LIST[game.grid[position]]
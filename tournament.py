@@ -0,0 +1,180 @@
+import argparse
+import importlib
+import itertools
+import json
+import random
+import statistics
+import time
+from multiprocessing import Pool, cpu_count
+
+import numpy as np
+
+from ai_scheduler import AI_BUDGET
+from main import GameEnvironment, MAXIUM_TURNS, MAX_REGROUP_TURN, ENEMY_NUMBER, check_config
+from settings import GRID_SIZE, DIRECTIONS
+from terrain import EMPTY
+
+MUD_PROBABILITY = 0.2
+CLEAR_PROBABILITY = 0.1
+DANGER_DISTANCE = 3
+
+
+def random_policy(state, rng):
+    move = rng.choice(list(DIRECTIONS) + [None])
+    mud_direction = rng.choice(list(DIRECTIONS)) if rng.random() < MUD_PROBABILITY else None
+    return move, mud_direction, rng.random() < CLEAR_PROBABILITY
+
+
+def flee_policy(state, rng):
+    x, y = state["player_pos"]
+    grid = state["grid"]
+    width, height = grid.shape
+    npcs = state["npc_positions"]
+
+    def danger(pos):
+        return min((abs(pos[0] - nx) + abs(pos[1] - ny) for nx, ny in npcs), default=width + height)
+
+    nearby = sum(1 for nx, ny in npcs if abs(nx - x) <= DANGER_DISTANCE and abs(ny - y) <= DANGER_DISTANCE)
+    best_move, best_danger = None, danger((x, y))
+    for name, (dx, dy) in DIRECTIONS.items():
+        nx, ny = x + dx, y + dy
+        if 0 <= nx < width and 0 <= ny < height and grid[nx, ny] == EMPTY and danger((nx, ny)) > best_danger:
+            best_move, best_danger = name, danger((nx, ny))
+
+    mud_direction = None
+    if best_move is not None and state["modify_cooldown"] == 0:
+        dx, dy = DIRECTIONS[best_move]
+        mud_direction = next(name for name, offset in DIRECTIONS.items() if offset == (-dx, -dy))
+    return best_move, mud_direction, nearby >= 2 and state["clear_cooldown"] == 0
+
+
+POLICIES = {
+    "random": random_policy,
+    "flee": flee_policy
+}
+
+
+def load_policy(name):
+    if name in POLICIES:
+        return POLICIES[name]
+    module_name, _, function_name = name.partition(":")
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+def play_game(task):
+    game_id, seed, policy_name, config = task
+    random.seed(seed)
+    np.random.seed(seed)
+    policy = load_policy(policy_name)
+    rng = random.Random(seed)
+
+    started = time.perf_counter()
+    game = GameEnvironment(**config)
+    setup_time = time.perf_counter() - started
+    state, done = game.get_state(), False
+    while not done:
+        state, _, done = game.step(policy(state, rng))
+
+    return {
+        "game": game_id,
+        "seed": seed,
+        "policy": policy_name,
+        "config": config,
+        "score": game.point,
+        "captures": game.captures,
+        "kills": game.kills,
+        "turns": game.max_turns,
+        "setup_time": setup_time,
+        "phase_times": dict(game.phase_times),
+        "scheduler": dict(game.scheduler.totals),
+        "total_time": time.perf_counter() - started
+    }
+
+
+def describe(values):
+    return {
+        "mean": statistics.fmean(values),
+        "stdev": statistics.stdev(values) if len(values) > 1 else 0.0,
+        "min": min(values),
+        "max": max(values)
+    }
+
+
+def summarize(results):
+    groups = {}
+    for result in results:
+        groups.setdefault(json.dumps(result["config"], sort_keys=True), []).append(result)
+
+    summary = []
+    for key, group in sorted(groups.items()):
+        turns = sum(result["turns"] for result in group)
+        phases = group[0]["phase_times"]
+        summary.append({
+            "config": json.loads(key),
+            "games": len(group),
+            "score": describe([result["score"] for result in group]),
+            "captures": describe([result["captures"] for result in group]),
+            "kills": describe([result["kills"] for result in group]),
+            "phase_ms_per_turn": {phase: 1000 * sum(result["phase_times"][phase] for result in group) / turns
+                                  for phase in phases},
+            "setup_ms": 1000 * statistics.fmean(result["setup_time"] for result in group)
+        })
+    return summary
+
+
+def parse_values(text):
+    return [int(value) for value in text.split(",")]
+
+
+def parse_budget(text):
+    return None if text.lower() == "none" else int(text)
+
+
+def build_tasks(args):
+    tasks = []
+    configs = itertools.product(args.grid_size, args.enemies, args.turns, args.regroup)
+    for grid_size, enemies, turns, regroup in configs:
+        check_config(grid_size, enemies)
+        config = {"grid_size": grid_size, "enemy_number": enemies, "max_turns": turns, "regroup_turns": regroup,
+                  "ai_budget": args.ai_budget}
+        for game in range(args.games):
+            tasks.append((len(tasks), args.seed + game, args.policy, config))
+    return tasks
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run headless games across a process pool and aggregate the results.")
+    parser.add_argument("--games", type=int, default=100, help="games per configuration")
+    parser.add_argument("--workers", type=int, default=cpu_count())
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first game; game i uses seed + i")
+    parser.add_argument("--policy", default="random", help="random, flee or module:function")
+    parser.add_argument("--grid-size", type=parse_values, default=[GRID_SIZE])
+    parser.add_argument("--enemies", type=parse_values, default=[ENEMY_NUMBER])
+    parser.add_argument("--turns", type=parse_values, default=[MAXIUM_TURNS])
+    parser.add_argument("--regroup", type=parse_values, default=[MAX_REGROUP_TURN])
+    parser.add_argument("--ai-budget", type=parse_budget, default=AI_BUDGET,
+                        help="A* node expansions the AI may spend replanning per tick, or none")
+    parser.add_argument("--results", default="tournament_results.jsonl")
+    parser.add_argument("--summary", default="tournament_summary.json")
+    args = parser.parse_args()
+
+    tasks = build_tasks(args)
+    results = []
+    with open(args.results, "w") as results_file, Pool(args.workers) as pool:
+        for result in pool.imap_unordered(play_game, tasks):
+            results.append(result)
+            results_file.write(json.dumps(result) + "\n")
+            results_file.flush()
+            print(f"[{len(results)}/{len(tasks)}] game {result['game']} seed {result['seed']}: "
+                  f"score {result['score']}, captures {result['captures']}, kills {result['kills']}")
+
+    summary = summarize(results)
+    with open(args.summary, "w") as summary_file:
+        json.dump(summary, summary_file, indent=2)
+    for entry in summary:
+        print(f"{entry['config']}: score {entry['score']['mean']:.1f} +/- {entry['score']['stdev']:.1f} "
+              f"over {entry['games']} games")
+
+
+if __name__ == "__main__":
+    main()